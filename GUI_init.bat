@@ -12,7 +12,7 @@ python --version >nul 2>&1
 if errorlevel 1 (
     echo Error: Python not found in PATH
     echo.
-    echo Please install Python 3.8 or higher
+    echo Please install Python 3.10 or higher
     pause
     exit /b 1
 )
@@ -6,12 +6,19 @@ Splits multi-channel TIFF stacks into separate channel folders within the source
 Author: Oriana Chen
 """
 import os
+import logging
 import shutil
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
 from tqdm import tqdm
 
+from folder_utils import Location
+
+logger = logging.getLogger(__name__)
+
 
 class ChannelSplitter:
     """Handles splitting of multi-channel images into separate channels in place."""
@@ -40,22 +47,47 @@ class ChannelSplitter:
         Returns:
             True if successful
         """
+        success, message, error = self._split_location(location_folder, location_name)
+        logger.log(self._message_level(success, error), message)
+        
+        if success:
+            self.processed_count += 1
+        elif error is not None:
+            self.failed_locations.append((location_folder, error))
+        return success
+    
+    @staticmethod
+    def _message_level(success: bool, error: Optional[str]) -> int:
+        """Logging level for a _split_location status message."""
+        if success:
+            return logging.INFO
+        return logging.ERROR if error is not None else logging.WARNING
+    
+    def _split_location(self, location_folder: str, location_name: str) -> Tuple[bool, str, Optional[str]]:
+        """
+        Split channels for a single location without touching shared state.
+        
+        Returns:
+            Tuple of (success, status message, error or None)
+        """
         try:
             location_path = Path(location_folder)
             
             if not location_path.exists():
-                print(f"  ✗ Location folder not found: {location_folder}")
-                return False
+                return False, f"  ✗ Location folder not found: {location_folder}", None
             
             # Find all TIFF files in the root of location folder
-            tif_files = sorted([
-                f for f in location_path.iterdir()
-                if f.suffix.lower() == '.tif' and f.is_file()
-            ])
+            with os.scandir(location_path) as entries:
+                # normcase keeps the order of the old sorted(Path) (case-folded on Windows)
+                tif_names = sorted(
+                    (entry.name for entry in entries
+                     if entry.name.lower().endswith('.tif') and entry.is_file(follow_symlinks=False)),
+                    key=os.path.normcase
+                )
+            tif_files = [location_path / name for name in tif_names]
             
             if not tif_files:
-                print(f"  ⚠ No .tif files found in: {location_folder}")
-                return False
+                return False, f"  ⚠ No .tif files found in: {location_folder}", None
             
             total_files = len(tif_files)
             
@@ -76,57 +108,100 @@ class ChannelSplitter:
                 channel_folder = location_path / f"{location_name}_{channel_name}"
                 channel_folder.mkdir(parents=True, exist_ok=True)
                 
-                # Move files to channel folder
+                # Move files to channel folder (plain rename within the location;
+                # shutil.move only if the rename fails, e.g. across devices)
                 for file in file_segment:
                     target_file = channel_folder / file.name
                     if not target_file.exists():
-                        shutil.move(str(file), str(target_file))
+                        try:
+                            os.replace(file, target_file)
+                        except OSError:
+                            shutil.move(str(file), str(target_file))
             
-            print(f"  ✓ Split {total_files} files into {self.num_channels} channels")
-            self.processed_count += 1
-            return True
+            return True, f"  ✓ Split {total_files} files into {self.num_channels} channels", None
             
         except Exception as e:
-            print(f"  ✗ Error splitting channels: {e}")
-            self.failed_locations.append((location_folder, str(e)))
-            return False
+            return False, f"  ✗ Error splitting channels: {e}", str(e)
     
-    def batch_split(self, locations: List[Dict[str, str]]) -> Dict[str, int]:
+    def batch_split(
+        self,
+        locations: List[Location],
+        max_workers: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None,
+        progress_cb: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, int]:
         """
         Batch process multiple locations in place.
         
+        Splitting is dominated by file renames, so locations are processed on
+        a thread pool; results are reported in completion order.
+        
         Args:
-            locations: List of location dictionaries with 'path' and 'location' keys
+            locations: List of Location records
+            max_workers: Number of worker threads (default: CPU count)
+            stop_event: Optional event; once set, locations not yet started are skipped
+            progress_cb: Optional callback called as progress_cb(done, total) after each location
         
         Returns:
             Dictionary with processing statistics
         """
-        print("\n" + "=" * 80)
-        print("CHANNEL SPLITTING (IN-PLACE)")
-        print("=" * 80)
-        print(f"Processing {len(locations)} locations...")
+        logger.info("=" * 80)
+        logger.info("CHANNEL SPLITTING (IN-PLACE)")
+        logger.info("=" * 80)
+        logger.info(f"Processing {len(locations)} locations...")
         
         self.processed_count = 0
         self.failed_locations = []
         
-        for idx, loc_info in enumerate(tqdm(locations, desc="Splitting channels"), 1):
-            location_name = loc_info['location']
-            location_path = loc_info['path']
-            
-            print(f"\n[{idx}/{len(locations)}] {loc_info['rep']} - {loc_info['timepoint']} - {loc_info['datatype']} - {location_name}")
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(locations)))) as executor:
+            futures = {
+                executor.submit(self._split_location, loc_info.path, loc_info.location): loc_info
+                for loc_info in locations
+            }
             
-            self.split_location(location_path, location_name)
+            pbar = tqdm(
+                as_completed(futures), total=len(futures),
+                desc="Splitting channels", mininterval=0.5, disable=None
+            )
+            stopped = False
+            for idx, future in enumerate(pbar, 1):
+                if not stopped and stop_event is not None and stop_event.is_set():
+                    # Running splits finish and are still reported; queued ones never start
+                    stopped = True
+                    for pending in futures:
+                        pending.cancel()
+                    logger.warning("⚠ Channel splitting stopped by user")
+                if future.cancelled():
+                    continue
+                
+                loc_info = futures[future]
+                success, message, error = future.result()
+                
+                pbar.set_postfix_str(loc_info.location, refresh=False)
+                logger.info(f"[{idx}/{len(locations)}] {loc_info.rep} - {loc_info.timepoint} - {loc_info.datatype} - {loc_info.location}")
+                logger.log(self._message_level(success, error), message)
+                
+                if success:
+                    self.processed_count += 1
+                elif error is not None:
+                    self.failed_locations.append((loc_info.path, error))
+                
+                if progress_cb is not None:
+                    progress_cb(idx, len(locations))
         
         # Summary
-        print("\n" + "=" * 80)
-        print("CHANNEL SPLITTING COMPLETE")
-        print("=" * 80)
-        print(f"Successfully processed: {self.processed_count}/{len(locations)}")
+        logger.info("=" * 80)
+        logger.info("CHANNEL SPLITTING COMPLETE")
+        logger.info("=" * 80)
+        logger.info(f"Successfully processed: {self.processed_count}/{len(locations)}")
         
         if self.failed_locations:
-            print(f"\nFailed locations ({len(self.failed_locations)}):")
+            logger.warning(f"Failed locations ({len(self.failed_locations)}):")
             for loc, error in self.failed_locations:
-                print(f"  - {loc}: {error}")
+                logger.warning(f"  - {loc}: {error}")
         
         return {
             'total': len(locations),
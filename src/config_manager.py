@@ -6,9 +6,14 @@ Handles user configuration including paths and parameters.
 Author: Oriana Chen
 """
 import os
+import copy
 import json
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+
+
+# Parsed config files keyed by absolute path: ((mtime_ns, size), config dict)
+_CONFIG_CACHE: Dict[str, Tuple[Tuple[int, int], dict]] = {}
 
 
 class ConfigManager:
@@ -23,6 +28,8 @@ class ConfigManager:
         """
         self.config_file = config_file
         self.config = {}
+        # (abspath, (mtime_ns, size)) of the last file applied by load_config
+        self._last_loaded: Optional[Tuple[str, Tuple[int, int]]] = None
         
         # Default configuration
         self.defaults = {
@@ -41,22 +48,51 @@ class ConfigManager:
         if config_file and os.path.exists(config_file):
             self.load_config(config_file)
     
-    def load_config(self, config_file: str):
+    def load_config(self, config_file: Union[str, Path]):
         """Load configuration from JSON file."""
         try:
-            with open(config_file, 'r') as f:
-                loaded_config = json.load(f)
+            cache_key = os.path.abspath(config_file)
+            st = os.stat(config_file)
+            stamp = (st.st_mtime_ns, st.st_size)
+            
+            cached = _CONFIG_CACHE.get(cache_key)
+            if cached is not None and cached[0] == stamp:
+                loaded_config = copy.deepcopy(cached[1])
+            else:
+                loaded_config = json.loads(Path(config_file).read_bytes())
+                _CONFIG_CACHE[cache_key] = (stamp, copy.deepcopy(loaded_config))
             self.config.update(loaded_config)
+            self._last_loaded = (cache_key, stamp)
             print(f"✓ Configuration loaded from {config_file}")
-        except Exception as e:
+        except (OSError, ValueError, TypeError) as e:
             print(f"⚠ Failed to load config file: {e}")
             print("Using default configuration.")
     
+    def is_loaded(self, config_file: Union[str, Path]) -> bool:
+        """
+        Check whether config_file was already applied and is unchanged on disk.
+        
+        Args:
+            config_file: Path to configuration JSON file
+            
+        Returns:
+            True if the last load_config used this file at its current mtime/size
+        """
+        if self._last_loaded is None:
+            return False
+        try:
+            st = os.stat(config_file)
+        except OSError:
+            return False
+        return self._last_loaded == (os.path.abspath(config_file),
+                                     (st.st_mtime_ns, st.st_size))
+    
     def save_config(self, config_file: str):
         """Save configuration to JSON file."""
         try:
             with open(config_file, 'w') as f:
                 json.dump(self.config, f, indent=2)
+            _CONFIG_CACHE.pop(os.path.abspath(config_file), None)
             print(f"✓ Configuration saved to {config_file}")
         except Exception as e:
             print(f"✗ Failed to save config file: {e}")
@@ -7,80 +7,156 @@ Now supports subtrack-based analysis with Red/Green ratio calculation.
 Author: Oriana Chen
 """
 import os
-import time
+import logging
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import numpy as np
 import pandas as pd
 import tifffile
+from scipy import ndimage
+from tqdm import tqdm
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from folder_utils import Location
+
+logger = logging.getLogger(__name__)
+
+
+# Bits reserved for the frame index in packed (TRACK_ID, FRAME) keys
+FRAME_BITS = 20
+
+# Largest (track x frame) lookup table built as a dense array (128 MB of int32)
+LOOKUP_MAX_CELLS = 1 << 25
+
+# Spots CSV column positions used for intensity extraction
+SPOTS_COLUMNS = {2: 'TRACK_ID', 4: 'POSITION_X', 5: 'POSITION_Y', 8: 'FRAME'}
+
+# Without Numba, frames with at most this many requested labels are averaged
+# per bounding box instead of with ndimage.mean over the whole frame
+BBOX_MAX_LABELS = 32
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _label_means_kernel(seg_frame, red_frame, green_frame, slot_of_label, n_slots):
+        """Red and green mean intensity per requested label in one pass over the frame."""
+        red_sums = np.zeros(n_slots, dtype=np.float64)
+        green_sums = np.zeros(n_slots, dtype=np.float64)
+        counts = np.zeros(n_slots, dtype=np.int64)
+        
+        n_labels = slot_of_label.shape[0]
+        for r in range(seg_frame.shape[0]):
+            for c in range(seg_frame.shape[1]):
+                label = seg_frame[r, c]
+                if label <= 0 or label >= n_labels:
+                    continue
+                slot = slot_of_label[label]
+                if slot < 0:
+                    continue
+                red_sums[slot] += red_frame[r, c]
+                green_sums[slot] += green_frame[r, c]
+                counts[slot] += 1
+        
+        return red_sums / counts, green_sums / counts
+else:
+    _label_means_kernel = None
+
+
+class _PagedStack:
+    """Compressed TIFF stack whose frames are decoded one page at a time on access."""
+    
+    def __init__(self, tif: tifffile.TiffFile):
+        self._pages = tif.series[0].pages
+        self.shape = tuple(tif.series[0].shape)
+    
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        return self._pages[frame_idx].asarray()
 
 
 class FluorescenceAnalyzer:
     """Analyzes fluorescence intensity from tracking results based on subtracks."""
     
-    def __init__(self, input_mask_folder: str):
+    def __init__(self, input_mask_folder: Union[str, Path]):
         """
         Initialize fluorescence analyzer.
         
         Args:
             input_mask_folder: Folder containing segmentation masks
         """
-        self.input_mask_folder = input_mask_folder
+        self.input_mask_folder = Path(input_mask_folder)
+        # Threads for decoding compressed TIFF pages
+        self.decode_workers = max(1, (os.cpu_count() or 1) // 2)
         self.processed_count = 0
         self.failed_locations = []
         self.skipped_locations = []
     
-    def analyze_location(self, location_info: Dict[str, str]) -> bool:
+    def analyze_location(self, location_info: Location) -> bool:
         """
         Analyze fluorescence for a single location based on subtracks.
         
         Args:
-            location_info: Location dictionary
+            location_info: Location record
         
         Returns:
             True if successful
         """
         try:
-            location_path = Path(location_info['path'])
-            location_name = location_info['location']
+            location_path = Path(location_info.path)
+            location_name = location_info.location
             
             # Find Tracking Result folder
             tracking_result_path = location_path / "Tracking Result"
-            if not tracking_result_path.exists():
-                print(f"  ✗ No Tracking Result folder found")
+            tracking_entries = self._scan_once(tracking_result_path)
+            if tracking_entries is None:
+                logger.error(f"  ✗ No Tracking Result folder found")
                 self.skipped_locations.append(str(location_path))
                 return False
             
             # Check for secondary_analysis folder and subtrack files
             secondary_analysis_path = tracking_result_path / "secondary_analysis"
-            if not secondary_analysis_path.exists():
-                print(f"  ✗ No secondary_analysis folder found (run subtrack analysis first)")
+            secondary_entries = self._scan_once(secondary_analysis_path)
+            if secondary_entries is None:
+                logger.error(f"  ✗ No secondary_analysis folder found (run subtrack analysis first)")
                 self.skipped_locations.append(str(location_path))
                 return False
             
             # Find subtrack lineage file
-            subtrack_lineage_files = list(secondary_analysis_path.glob("*-subtrack_lineage.csv"))
+            subtrack_lineage_files = [
+                secondary_analysis_path / entry.name for entry in secondary_entries
+                if entry.name.endswith('-subtrack_lineage.csv') and not entry.name.startswith('.')
+            ]
             if not subtrack_lineage_files:
-                print(f"  ✗ No subtrack lineage file found")
+                logger.error(f"  ✗ No subtrack lineage file found")
                 self.skipped_locations.append(str(location_path))
                 return False
             
             subtrack_lineage_path = subtrack_lineage_files[0]
             prefix = subtrack_lineage_path.stem.replace('-subtrack_lineage', '')
-            output_csv_path = secondary_analysis_path / f"{prefix}-subtrack_fluorescence.csv"
+            output_name = f"{prefix}-subtrack_fluorescence.csv"
+            output_csv_path = secondary_analysis_path / output_name
             
             # Check if already processed
-            if output_csv_path.exists():
-                print(f"  ⏩ Already processed")
+            if any(entry.name == output_name for entry in secondary_entries):
+                logger.info(f"  ⏩ Already processed")
                 self.skipped_locations.append(str(location_path))
                 return True
             
             # Find spots CSV file
-            spot_files = list(tracking_result_path.glob("*-spots.csv"))
-            spot_files = [f for f in spot_files if 'all' not in f.name.lower()]
+            spot_files = [
+                tracking_result_path / entry.name for entry in tracking_entries
+                if entry.name.endswith('-spots.csv') and not entry.name.startswith('.')
+                and 'all' not in entry.name.lower()
+            ]
             
             if not spot_files:
-                print(f"  ✗ No spots CSV file found")
+                logger.error(f"  ✗ No spots CSV file found")
                 self.skipped_locations.append(str(location_path))
                 return False
             
@@ -89,15 +165,15 @@ class FluorescenceAnalyzer:
             # Find segmentation mask
             from folder_utils import get_location_identifier
             location_id = get_location_identifier(
-                location_info['rep'],
-                location_info['timepoint'],
-                location_info['datatype'],
+                location_info.rep,
+                location_info.timepoint,
+                location_info.datatype,
                 location_name
             )
-            segmentation_tif_path = Path(self.input_mask_folder) / f"{location_id}_Red_Seg.tif"
+            segmentation_tif_path = self.input_mask_folder / f"{location_id}_Red_Seg.tif"
             
             if not segmentation_tif_path.exists():
-                print(f"  ✗ Segmentation mask not found: {segmentation_tif_path.name}")
+                logger.error(f"  ✗ Segmentation mask not found: {segmentation_tif_path.name}")
                 self.failed_locations.append(str(location_path))
                 return False
             
@@ -106,72 +182,154 @@ class FluorescenceAnalyzer:
             green_fluor_path = location_path / f"{location_name}_Green_Stabilized.tif"
             
             if not (red_fluor_path.exists() and green_fluor_path.exists()):
-                print(f"  ✗ Red or Green fluorescence images missing")
+                logger.error(f"  ✗ Red or Green fluorescence images missing")
                 self.failed_locations.append(str(location_path))
                 return False
             
             # Load data
-            print(f"  Loading subtrack lineage...")
+            logger.info(f"  Loading subtrack lineage...")
             subtrack_lineage_df = pd.read_csv(subtrack_lineage_path)
             
-            print(f"  Loading spots CSV...")
+            logger.info(f"  Loading spots CSV...")
             spots_df = self._load_spots_csv(spots_csv_path)
             
-            print(f"  Loading images...")
-            seg_stack = tifffile.imread(segmentation_tif_path)
-            red_fluor_stack = tifffile.imread(red_fluor_path)
-            green_fluor_stack = tifffile.imread(green_fluor_path)
-            
-            # Validate shapes
-            if not (seg_stack.shape == red_fluor_stack.shape == green_fluor_stack.shape):
-                print(f"  ✗ Image shape mismatch")
+            # Validate shapes from the TIFF headers before touching any pixels
+            if not (self._stack_shape(segmentation_tif_path) ==
+                    self._stack_shape(red_fluor_path) ==
+                    self._stack_shape(green_fluor_path)):
+                logger.error(f"  ✗ Image shape mismatch")
                 self.failed_locations.append(str(location_path))
                 return False
             
-            # Extract intensities per subtrack
-            print(f"  Extracting intensities per subtrack...")
-            subtrack_green, subtrack_red = self._extract_subtrack_intensities(
-                subtrack_lineage_df, spots_df, seg_stack, red_fluor_stack, green_fluor_stack
-            )
+            logger.info(f"  Loading images...")
+            with ExitStack() as open_files:
+                seg_stack = self._load_stack(segmentation_tif_path, open_files)
+                red_fluor_stack = self._load_stack(red_fluor_path, open_files)
+                green_fluor_stack = self._load_stack(green_fluor_path, open_files)
+                
+                # Dense (subtrack x frame) intensity arrays, NaN where not measured
+                subtrack_ids = sorted(subtrack_lineage_df['SUBTRACK_ID'].unique())
+                subtrack_idx = {sid: i for i, sid in enumerate(subtrack_ids)}
+                green_arr = np.full((len(subtrack_ids), seg_stack.shape[0]), np.nan, dtype=np.float32)
+                red_arr = np.full_like(green_arr, np.nan)
+                
+                # Extract intensities per subtrack
+                logger.info(f"  Extracting intensities per subtrack...")
+                self._extract_subtrack_intensities(
+                    subtrack_lineage_df, spots_df, seg_stack, red_fluor_stack, green_fluor_stack,
+                    subtrack_idx, green_arr, red_arr
+                )
             
-            if not subtrack_green:
-                print(f"  ✗ No valid subtracks found")
+            measured = ~np.isnan(green_arr).all(axis=1)
+            if not measured.any():
+                logger.error(f"  ✗ No valid subtracks found")
                 self.failed_locations.append(str(location_path))
                 return False
             
             # Format output
-            print(f"  Formatting output...")
-            output_df = self._format_output(subtrack_green, subtrack_red, seg_stack.shape[0])
+            logger.info(f"  Formatting output...")
+            output_df = self._format_output(
+                [sid for sid, keep in zip(subtrack_ids, measured) if keep],
+                green_arr[measured],
+                red_arr[measured]
+            )
             
-            # Save
-            output_df.to_csv(output_csv_path)
-            print(f"  ✓ Saved: {output_csv_path.name}")
+            # Save (written in row chunks rather than one large string)
+            output_df.to_csv(output_csv_path, chunksize=1024)
+            logger.info(f"  ✓ Saved: {output_csv_path.name}")
             
             self.processed_count += 1
             return True
             
         except Exception as e:
-            print(f"  ✗ Error: {e}")
-            self.failed_locations.append(str(location_info['path']))
+            logger.error(f"  ✗ Error: {e}")
+            self.failed_locations.append(str(location_info.path))
             return False
     
     def _load_spots_csv(self, csv_path: Path) -> pd.DataFrame:
-        """Load spots CSV file."""
-        columns = [
-            'LABEL', 'ID', 'TRACK_ID', 'QUALITY',
-            'POSITION_X', 'POSITION_Y', 'POSITION_Z', 'POSITION_T',
-            'FRAME', 'RADIUS', 'VISIBILITY', 'MANUAL_SPOT_COLOR',
-            'MEAN_INTENSITY_CH1', 'MEDIAN_INTENSITY_CH1', 'MIN_INTENSITY_CH1',
-            'MAX_INTENSITY_CH1', 'TOTAL_INTENSITY_CH1', 'STD_INTENSITY_CH1',
-            'CONTRAST_CH1', 'SNR_CH1',
-            'ELLIPSE_X0', 'ELLIPSE_Y0', 'ELLIPSE_MAJOR', 'ELLIPSE_MINOR',
-            'ELLIPSE_THETA', 'ELLIPSE_ASPECTRATIO', 'AREA', 'PERIMETER',
-            'CIRCULARITY', 'SOLIDITY', 'SHAPE_INDEX'
+        """
+        Load the columns of a spots CSV file used for intensity extraction.
+        
+        Only TRACK_ID, POSITION_X, POSITION_Y and FRAME are parsed. Other
+        TrackMate columns can be read with pd.read_csv on the same file if
+        needed.
+        """
+        read_kwargs = dict(
+            skiprows=3, header=None, engine='c',
+            usecols=list(SPOTS_COLUMNS), names=list(SPOTS_COLUMNS.values())
+        )
+        
+        try:
+            return pd.read_csv(csv_path, dtype=np.float64, **read_kwargs)
+        except ValueError:
+            # Leftover header/units rows: read as text, values are coerced later
+            return pd.read_csv(csv_path, **read_kwargs)
+    
+    def _is_already_done(self, location_info: Location) -> bool:
+        """
+        Check whether a location's fluorescence CSV already exists.
+        
+        Only lists the secondary_analysis folder; no data is read.
+        """
+        secondary_analysis_path = Path(location_info.path) / "Tracking Result" / "secondary_analysis"
+        entries = self._scan_once(secondary_analysis_path)
+        if entries is None:
+            return False
+        
+        # Same lineage file choice as analyze_location
+        lineage_names = [
+            entry.name for entry in entries
+            if entry.name.endswith('-subtrack_lineage.csv') and not entry.name.startswith('.')
         ]
+        if not lineage_names:
+            return False
+        
+        prefix = Path(lineage_names[0]).stem.replace('-subtrack_lineage', '')
+        output_name = f"{prefix}-subtrack_fluorescence.csv"
+        return any(entry.name == output_name for entry in entries)
+    
+    def _scan_once(self, folder: Path) -> Optional[List[os.DirEntry]]:
+        """
+        List a directory in a single read.
+        
+        Returns:
+            Directory entries, or None if the folder does not exist
+        """
+        try:
+            with os.scandir(folder) as entries:
+                return list(entries)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+    
+    def _stack_shape(self, tif_path: Path) -> tuple:
+        """Read the stack shape from the TIFF header without loading pixel data."""
+        with tifffile.TiffFile(tif_path) as tif:
+            return tuple(tif.series[0].shape)
+    
+    def _load_stack(self, tif_path: Path, open_files: ExitStack):
+        """
+        Open a TIFF stack for frame-by-frame reading.
+        
+        Uncompressed stacks are memory-mapped so only the frames being processed
+        are paged in. Compressed stacks with one page per frame (such as the
+        zlib masks written by segmentation) are decoded one page at a time as
+        frames are indexed; the file stays open until open_files is closed.
+        Anything else is decoded fully, using decode_workers threads across pages.
         
-        spots_df = pd.read_csv(csv_path, skiprows=3, header=None)
-        spots_df.columns = columns
-        return spots_df
+        Returns:
+            Object with a shape attribute whose [frame_idx] is one 2D frame
+        """
+        with tifffile.TiffFile(tif_path) as tif:
+            if tif.pages[0].compression == tifffile.COMPRESSION.NONE:
+                try:
+                    return tifffile.memmap(tif_path, mode='r')
+                except ValueError:
+                    pass
+            else:
+                series = tif.series[0]
+                if len(series.shape) == 3 and len(series.pages) == series.shape[0]:
+                    return _PagedStack(open_files.enter_context(tifffile.TiffFile(tif_path)))
+            return tif.asarray(maxworkers=self.decode_workers)
     
     def _extract_subtrack_intensities(
         self,
@@ -179,120 +337,177 @@ class FluorescenceAnalyzer:
         spots_df: pd.DataFrame,
         seg_stack: np.ndarray,
         red_fluor_stack: np.ndarray,
-        green_fluor_stack: np.ndarray
-    ) -> Tuple[dict, dict]:
+        green_fluor_stack: np.ndarray,
+        subtrack_idx: Dict[str, int],
+        green_arr: np.ndarray,
+        red_arr: np.ndarray
+    ):
         """
         Extract fluorescence intensities for each subtrack at each frame.
         
-        Returns:
-            (subtrack_green, subtrack_red) dictionaries mapping subtrack_id -> {frame_idx -> intensity}
+        Fills green_arr / red_arr (shape: n_subtracks x n_frames) in place, where
+        row subtrack_idx[subtrack_id] holds the per-frame mean intensities.
         """
-        subtrack_green = {}
-        subtrack_red = {}
-        
-        # Build mapping: (TRACK_ID, FRAME) -> SUBTRACK_ID
-        track_frame_to_subtrack = {}
-        for _, row in subtrack_lineage_df.iterrows():
-            subtrack_id = row['SUBTRACK_ID']
-            track_id = int(row['TRACK_ID'])
-            start_frame = int(row['START_FRAME'])
-            end_frame = int(row['END_FRAME'])
-            
-            for frame in range(start_frame, end_frame + 1):
-                track_frame_to_subtrack[(track_id, frame)] = subtrack_id
+        # Build mapping: (TRACK_ID, FRAME) -> subtrack row by expanding each
+        # [START_FRAME, END_FRAME] range with NumPy instead of a Python loop
+        track_ids = subtrack_lineage_df['TRACK_ID'].to_numpy(dtype=np.int64)
+        starts = subtrack_lineage_df['START_FRAME'].to_numpy(dtype=np.int64)
+        ends = subtrack_lineage_df['END_FRAME'].to_numpy(dtype=np.int64)
+        subtrack_rows = np.array(
+            [subtrack_idx[sid] for sid in subtrack_lineage_df['SUBTRACK_ID']], dtype=np.int64
+        )
+        
+        lengths = np.maximum(ends - starts + 1, 0)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        frames = np.repeat(starts, lengths) + offsets
+        rep_tracks = np.repeat(track_ids, lengths)
+        rep_rows = np.repeat(subtrack_rows, lengths)
+        
+        n_frames = seg_stack.shape[0]
+        
+        # TrackMate track IDs are small dense integers, so the mapping is
+        # normally a (track x frame) array of subtrack rows (-1 = none).
+        # Very large ID ranges fall back to a dict keyed by packed
+        # (TRACK_ID << FRAME_BITS) | FRAME ints.
+        in_range = (rep_tracks >= 0) & (frames >= 0) & (frames < n_frames)
+        n_tracks = int(rep_tracks[in_range].max()) + 1 if in_range.any() else 0
+        
+        if n_tracks * n_frames <= LOOKUP_MAX_CELLS:
+            subtrack_lookup = np.full((n_tracks, n_frames), -1, dtype=np.int32)
+            subtrack_lookup[rep_tracks[in_range], frames[in_range]] = rep_rows[in_range]
+            track_frame_to_subtrack = None
+        else:
+            subtrack_lookup = None
+            track_frame_to_subtrack = dict(zip(
+                ((rep_tracks << FRAME_BITS) | frames).tolist(),
+                rep_rows.tolist()
+            ))
+        
+        # Spot coordinates as arrays (unparsable rows are dropped), sorted by
+        # frame once so each frame is a contiguous slice
+        coords = spots_df[['FRAME', 'TRACK_ID', 'POSITION_X', 'POSITION_Y']].apply(
+            pd.to_numeric, errors='coerce'
+        ).dropna()
+        spot_frames = coords['FRAME'].to_numpy(dtype=np.int64)
+        order = np.argsort(spot_frames, kind='stable')
+        spot_frames = spot_frames[order]
+        spot_tracks = coords['TRACK_ID'].to_numpy(dtype=np.int64)[order]
+        spot_cols = np.rint(coords['POSITION_X'].to_numpy(dtype=np.float64)[order]).astype(np.intp)
+        spot_rows_px = np.rint(coords['POSITION_Y'].to_numpy(dtype=np.float64)[order]).astype(np.intp)
+        
+        frame_bounds = np.searchsorted(spot_frames, np.arange(n_frames + 1))
         
         # Extract intensities frame by frame
-        for frame_idx in range(seg_stack.shape[0]):
-            frame_spots = spots_df[spots_df['FRAME'] == frame_idx]
-            seg_frame = seg_stack[frame_idx]
-            red_fluor_frame = red_fluor_stack[frame_idx]
-            green_fluor_frame = green_fluor_stack[frame_idx]
+        for frame_idx in range(n_frames):
+            lo, hi = frame_bounds[frame_idx], frame_bounds[frame_idx + 1]
+            if lo == hi:
+                continue
             
-            for _, spot in frame_spots.iterrows():
-                try:
-                    track_id = int(spot['TRACK_ID'])
-                    x = float(spot['POSITION_X'])
-                    y = float(spot['POSITION_Y'])
-                except (KeyError, ValueError):
-                    continue
-                
-                # Check if this spot belongs to a subtrack
-                key = (track_id, frame_idx)
-                if key not in track_frame_to_subtrack:
-                    continue
-                
-                subtrack_id = track_frame_to_subtrack[key]
-                
-                col = int(round(x))
-                row = int(round(y))
-                
-                # Bounds check
-                if row < 0 or row >= seg_frame.shape[0] or col < 0 or col >= seg_frame.shape[1]:
-                    continue
-                
-                label_id = seg_frame[row, col]
-                if label_id == 0:
-                    continue
-                
-                # Create mask for this cell
-                mask = (seg_frame == label_id)
-                
-                # Extract intensities
-                red_cell_pixels = red_fluor_frame[mask]
-                green_cell_pixels = green_fluor_frame[mask]
-                
-                mean_red_intensity = np.mean(red_cell_pixels) if red_cell_pixels.size > 0 else np.nan
-                mean_green_intensity = np.mean(green_cell_pixels) if green_cell_pixels.size > 0 else np.nan
-                
-                if subtrack_id not in subtrack_green:
-                    subtrack_green[subtrack_id] = {}
-                    subtrack_red[subtrack_id] = {}
-                
-                subtrack_green[subtrack_id][frame_idx] = mean_green_intensity
-                subtrack_red[subtrack_id][frame_idx] = mean_red_intensity
+            seg_frame = np.asarray(seg_stack[frame_idx])
+            red_fluor_frame = np.asarray(red_fluor_stack[frame_idx])
+            green_fluor_frame = np.asarray(green_fluor_stack[frame_idx])
+            
+            track_ids = spot_tracks[lo:hi]
+            cols = spot_cols[lo:hi]
+            rows = spot_rows_px[lo:hi]
+            
+            # Keep spots that belong to a subtrack and fall inside the image
+            if subtrack_lookup is not None:
+                spot_rows = np.full(len(track_ids), -1, dtype=np.int64)
+                known = (track_ids >= 0) & (track_ids < n_tracks)
+                spot_rows[known] = subtrack_lookup[track_ids[known], frame_idx]
+            else:
+                spot_rows = np.fromiter(
+                    (track_frame_to_subtrack.get(key, -1) for key in ((track_ids << FRAME_BITS) | frame_idx).tolist()),
+                    dtype=np.int64, count=len(track_ids)
+                )
+            valid = spot_rows >= 0
+            valid &= (rows >= 0) & (rows < seg_frame.shape[0]) & (cols >= 0) & (cols < seg_frame.shape[1])
+            
+            label_ids = np.zeros(len(track_ids), dtype=seg_frame.dtype)
+            label_ids[valid] = seg_frame[rows[valid], cols[valid]]
+            valid &= label_ids != 0
+            if not valid.any():
+                continue
+            
+            # Mean intensity of every requested cell
+            unique_labels, label_pos = np.unique(label_ids[valid], return_inverse=True)
+            red_means, green_means = self._label_means(
+                seg_frame, red_fluor_frame, green_fluor_frame, unique_labels
+            )
+            
+            green_arr[spot_rows[valid], frame_idx] = green_means[label_pos]
+            red_arr[spot_rows[valid], frame_idx] = red_means[label_pos]
+    
+    def _label_means(
+        self,
+        seg_frame: np.ndarray,
+        red_fluor_frame: np.ndarray,
+        green_fluor_frame: np.ndarray,
+        labels: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean red and green intensity of each label in a frame.
+        
+        Uses a fused Numba kernel (one pass over the frame for both channels)
+        when Numba is installed. Otherwise a few labels are averaged inside
+        their bounding boxes from ndimage.find_objects, and larger sets use
+        scipy.ndimage.mean per channel.
+        
+        Args:
+            seg_frame: 2D label image
+            red_fluor_frame: 2D red fluorescence image
+            green_fluor_frame: 2D green fluorescence image
+            labels: Sorted, non-zero label IDs to measure
         
-        return subtrack_green, subtrack_red
+        Returns:
+            Tuple of (red_means, green_means) aligned with labels
+        """
+        if _label_means_kernel is not None:
+            slot_of_label = np.full(int(labels[-1]) + 1, -1, dtype=np.int64)
+            slot_of_label[labels] = np.arange(len(labels))
+            return _label_means_kernel(
+                seg_frame, red_fluor_frame, green_fluor_frame, slot_of_label, len(labels)
+            )
+        
+        if len(labels) <= BBOX_MAX_LABELS:
+            red_means = np.empty(len(labels), dtype=np.float64)
+            green_means = np.empty(len(labels), dtype=np.float64)
+            slices = ndimage.find_objects(seg_frame, max_label=int(labels[-1]))
+            for i, label in enumerate(labels.tolist()):
+                bbox = slices[label - 1]
+                mask = seg_frame[bbox] == label
+                red_means[i] = red_fluor_frame[bbox][mask].mean()
+                green_means[i] = green_fluor_frame[bbox][mask].mean()
+            return red_means, green_means
+        
+        red_means = ndimage.mean(red_fluor_frame, labels=seg_frame, index=labels)
+        green_means = ndimage.mean(green_fluor_frame, labels=seg_frame, index=labels)
+        return np.asarray(red_means), np.asarray(green_means)
     
     def _format_output(
         self,
-        subtrack_green: dict,
-        subtrack_red: dict,
-        max_frame: int
+        subtrack_ids: List[str],
+        green_arr: np.ndarray,
+        red_arr: np.ndarray
     ) -> pd.DataFrame:
         """
         Format output following original format: 
         - Rows: Subtracks (Subtrack_X_Green, Subtrack_X_Red, Subtrack_X_Ratio)
         - Columns: Frames (Frame0, Frame1, ...)
         """
-        subtrack_ids = sorted(subtrack_green.keys())
-        
-        # Build data arrays
-        green_data = []
-        red_data = []
-        ratio_data = []
+        n_subtracks = len(subtrack_ids)
         
-        for subtrack_id in subtrack_ids:
-            green_row = [subtrack_green[subtrack_id].get(f, np.nan) for f in range(max_frame)]
-            red_row = [subtrack_red[subtrack_id].get(f, np.nan) for f in range(max_frame)]
-            
-            # Calculate ratio row
-            ratio_row = []
-            for f in range(max_frame):
-                red_val = subtrack_red[subtrack_id].get(f, np.nan)
-                green_val = subtrack_green[subtrack_id].get(f, np.nan)
-                
-                if pd.notna(red_val) and pd.notna(green_val) and green_val > 0:
-                    ratio = red_val / green_val
-                else:
-                    ratio = np.nan
-                ratio_row.append(ratio)
-            
-            green_data.append(green_row)
-            red_data.append(red_row)
-            ratio_data.append(ratio_row)
+        # Combine: Green block, then Red block, then Ratio block, written
+        # straight into one preallocated array
+        final_data = np.empty((3 * n_subtracks, green_arr.shape[1]), dtype=np.float32)
+        final_data[:n_subtracks] = green_arr
+        final_data[n_subtracks:2 * n_subtracks] = red_arr
         
-        # Combine: Green block, then Red block, then Ratio block
-        final_data = green_data + red_data + ratio_data
+        # Ratio is only defined where green intensity is positive
+        ratio_block = final_data[2 * n_subtracks:]
+        ratio_block.fill(np.nan)
+        np.divide(red_arr, green_arr, out=ratio_block, where=green_arr > 0)
         
         # Build row names
         row_names = (
@@ -302,50 +517,119 @@ class FluorescenceAnalyzer:
         )
         
         # Build column names
-        col_names = [f"Frame{f}" for f in range(max_frame)]
+        col_names = [f"Frame{f}" for f in range(green_arr.shape[1])]
         
         # Create DataFrame
         output_df = pd.DataFrame(final_data, index=row_names, columns=col_names)
         
         return output_df
     
-    def batch_analyze(self, locations: List[Dict[str, str]]) -> Dict[str, int]:
+    def batch_analyze(
+        self,
+        locations: List[Location],
+        max_workers: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None
+    ) -> Dict[str, int]:
         """
         Batch analyze multiple locations.
         
+        Locations are independent, so they are analyzed in parallel worker
+        processes. Each worker's log records are collected and re-logged here
+        once its location finishes, keeping the log grouped per location.
+        
         Args:
-            locations: List of location dictionaries
+            locations: List of Location records
+            max_workers: Number of worker processes (default: CPU count).
+                Use 1 to analyze locations sequentially in this process.
+            stop_event: Optional event; once set, locations not yet started are skipped
         
         Returns:
             Dictionary with processing statistics
         """
-        print("\n" + "=" * 80)
-        print("FLUORESCENCE INTENSITY ANALYSIS")
-        print("=" * 80)
-        print(f"Processing {len(locations)} locations...")
+        logger.info("=" * 80)
+        logger.info("FLUORESCENCE INTENSITY ANALYSIS")
+        logger.info("=" * 80)
+        logger.info(f"Processing {len(locations)} locations...")
         
         self.processed_count = 0
         self.failed_locations = []
         self.skipped_locations = []
         
-        for idx, loc_info in enumerate(locations, 1):
-            location_name = loc_info['location']
-            print(f"\n[{idx}/{len(locations)}] {loc_info['rep']} - {loc_info['timepoint']} - {loc_info['datatype']} - {location_name}")
-            
-            self.analyze_location(loc_info)
-            time.sleep(0.1)
+        # Skip finished locations up front so reruns don't touch them again
+        pending = []
+        for loc_info in locations:
+            if self._is_already_done(loc_info):
+                self.skipped_locations.append(str(loc_info.path))
+            else:
+                pending.append(loc_info)
+        
+        if self.skipped_locations:
+            logger.info(f"⏩ Already processed: {len(self.skipped_locations)} locations")
+        
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, len(pending))
+        
+        if max_workers <= 1:
+            for idx, loc_info in enumerate(pending, 1):
+                if stop_event is not None and stop_event.is_set():
+                    logger.warning(f"⚠ Fluorescence analysis stopped by user after {idx - 1}/{len(pending)} locations")
+                    break
+                
+                location_name = loc_info.location
+                logger.info(f"[{idx}/{len(pending)}] {loc_info.rep} - {loc_info.timepoint} - {loc_info.datatype} - {location_name}")
+                
+                self.analyze_location(loc_info)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(_analyze_location_worker, self.input_mask_folder, loc_info): loc_info
+                    for loc_info in pending
+                }
+                
+                pbar = tqdm(
+                    as_completed(futures), total=len(futures),
+                    desc="Analyzing fluorescence", mininterval=0.5, disable=None
+                )
+                stopped = False
+                for idx, future in enumerate(pbar, 1):
+                    if not stopped and stop_event is not None and stop_event.is_set():
+                        # Running locations finish and are still reported; queued ones never start
+                        stopped = True
+                        for queued in futures:
+                            queued.cancel()
+                        logger.warning("⚠ Fluorescence analysis stopped by user")
+                    if future.cancelled():
+                        continue
+                    
+                    loc_info = futures[future]
+                    pbar.set_postfix_str(loc_info.location, refresh=False)
+                    logger.info(f"[{idx}/{len(pending)}] {loc_info.rep} - {loc_info.timepoint} - {loc_info.datatype} - {loc_info.location}")
+                    
+                    try:
+                        processed, failed, skipped, records = future.result()
+                    except Exception as e:
+                        logger.error(f"  ✗ Error: {e}")
+                        self.failed_locations.append(str(loc_info.path))
+                        continue
+                    
+                    for levelno, message in records:
+                        logger.log(levelno, message)
+                    self.processed_count += processed
+                    self.failed_locations.extend(failed)
+                    self.skipped_locations.extend(skipped)
         
         # Summary
-        print("\n" + "=" * 80)
-        print("FLUORESCENCE ANALYSIS COMPLETE")
-        print("=" * 80)
-        print(f"Successfully processed: {self.processed_count}/{len(locations)}")
-        print(f"Skipped: {len(self.skipped_locations)}")
+        logger.info("=" * 80)
+        logger.info("FLUORESCENCE ANALYSIS COMPLETE")
+        logger.info("=" * 80)
+        logger.info(f"Successfully processed: {self.processed_count}/{len(locations)}")
+        logger.info(f"Skipped: {len(self.skipped_locations)}")
         
         if self.failed_locations:
-            print(f"\nFailed locations ({len(self.failed_locations)}):")
+            logger.info(f"Failed locations ({len(self.failed_locations)}):")
             for loc in self.failed_locations:
-                print(f"  - {loc}")
+                logger.info(f"  - {loc}")
         
         return {
             'total': len(locations),
@@ -353,3 +637,52 @@ class FluorescenceAnalyzer:
             'failed': len(self.failed_locations),
             'skipped': len(self.skipped_locations)
         }
+
+
+def _analyze_location_worker(
+    input_mask_folder: Path,
+    location_info: Location
+) -> Tuple[int, List[str], List[str], List[Tuple[int, str]]]:
+    """
+    Analyze a single location in a worker process.
+    
+    Log records are collected instead of emitted, since the worker has no
+    handlers of its own; the parent re-logs them in order.
+    
+    Returns:
+        (processed_count, failed_locations, skipped_locations, [(levelno, message)])
+    """
+    analyzer = FluorescenceAnalyzer(input_mask_folder)
+    # Locations already run in parallel processes; decode each stack serially
+    analyzer.decode_workers = 1
+    
+    # Collect every level here; the parent's logging config decides what is shown
+    collector = _RecordCollector()
+    saved_level, saved_propagate = logger.level, logger.propagate
+    logger.addHandler(collector)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        analyzer.analyze_location(location_info)
+    finally:
+        logger.removeHandler(collector)
+        logger.setLevel(saved_level)
+        logger.propagate = saved_propagate
+    
+    return (
+        analyzer.processed_count,
+        analyzer.failed_locations,
+        analyzer.skipped_locations,
+        collector.records
+    )
+
+
+class _RecordCollector(logging.Handler):
+    """Logging handler that keeps (levelno, message) pairs for the parent process."""
+    
+    def __init__(self):
+        super().__init__()
+        self.records: List[Tuple[int, str]] = []
+    
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
@@ -6,26 +6,66 @@ Utility functions for folder scanning and path management.
 Author: Oriana Chen
 """
 import os
+import re
+import sys
+import json
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Callable, List, Tuple, Dict, Iterable, Iterator, Literal, NamedTuple, Optional, Union
 
 
+# Scan manifest written to the data root by scan_data_folder_structure(use_cache=True)
+SCAN_MANIFEST_NAME = '.scan_manifest.json'
+
+# Listing cache written to the search root by find_tracking_results(use_cache=True)
+TRACKING_CACHE_NAME = '.tracking_results.cache'
+
+# Translation table for get_location_identifier
+_SPACE_TO_DASH = str.maketrans({' ': '-'})
+
+# Folders already created by ensure_folder_exists in this process
+_ensured = set()
+
+# Rep folders are scanned on a thread pool when there are more than this many
+PARALLEL_REP_SCAN_MIN = 2
+
+# Most worker threads scanning Rep folders concurrently
+MAX_REP_SCAN_WORKERS = 32
+
+# Folder names never searched by find_tracking_results
+DEFAULT_SKIP_DIRS = frozenset({'.git', '__pycache__', 'node_modules', '.ipynb_checkpoints'})
+
+
+class Location(NamedTuple):
+    """A location folder found by scan_data_folder_structure."""
+    rep: str        # Replicate folder name (e.g., 'Rep 1')
+    timepoint: str  # Timepoint folder name (e.g., '0-24h')
+    datatype: str   # Data type folder name (e.g., 'Dense')
+    location: str   # Location name with any '_cropped' suffix removed
+    path: str       # Full path of the location folder
+
+
+@lru_cache(maxsize=4096)
 def clean_location_name(location_name: str) -> str:
     """
     Remove '_cropped' suffix from location name if present.
     
+    Results are memoized and interned, so records for the same location
+    share one string object.
+    
     Args:
         location_name: Original location folder name (e.g., 'A1_1_cropped')
     
     Returns:
         Cleaned location name (e.g., 'A1_1')
     """
-    if location_name.endswith('_cropped'):
-        return location_name[:-8]  # Remove last 8 characters ('_cropped')
-    return location_name
+    return sys.intern(location_name.removesuffix('_cropped'))
 
 
-def scan_data_folder_structure(root_folder: str) -> List[Dict[str, str]]:
+def scan_data_folder_structure(root_folder: str, use_cache: bool = False) -> List[Location]:
     """
     Scan data folder to find all locations.
     
@@ -38,77 +78,338 @@ def scan_data_folder_structure(root_folder: str) -> List[Dict[str, str]]:
     
     Args:
         root_folder: Root data folder path
+        use_cache: Reuse/write a scan manifest (SCAN_MANIFEST_NAME) in the root
+            folder. The manifest is valid while the modification times of all
+            scanned folders are unchanged.
     
     Returns:
-        List of location dictionaries with keys: rep, timepoint, datatype, location, path
+        List of Location records (rep, timepoint, datatype, location, path)
+    """
+    if not use_cache:
+        locations = list(iter_data_folder_structure(root_folder))
+        locations.sort(key=_location_sort_key)
+        return locations
+    
+    if os.path.exists(root_folder):
+        cached = _load_scan_manifest(root_folder)
+        if cached is not None:
+            return cached
+    
+    visited = []
+    locations = list(_iter_locations(root_folder, visited))
+    locations.sort(key=_location_sort_key)
+    if visited:
+        _save_scan_manifest(root_folder, locations, visited)
+    
+    return locations
+
+
+def iter_data_folder_structure(root_folder: str) -> Iterator[Location]:
+    """
+    Scan data folder, yielding locations as they are found.
+    
+    Same structure as scan_data_folder_structure, but callers can start on
+    the first locations while later folders are still being listed. Locations
+    come in directory listing order; scan_data_folder_structure sorts them.
+    
+    Args:
+        root_folder: Root data folder path
+    
+    Yields:
+        Location records (rep, timepoint, datatype, location, path)
+    """
+    return _iter_locations(root_folder, None)
+
+
+def _iter_locations(root_folder: str, visited: Optional[List[str]]) -> Iterator[Location]:
     """
-    locations = []
-    root_path = Path(root_folder)
+    Yield all locations under root_folder in directory listing order.
     
-    if not root_path.exists():
+    Args:
+        root_folder: Root data folder path
+        visited: Optional list that collects every folder listed
+    """
+    if not os.path.exists(root_folder):
         print(f"✗ Root folder not found: {root_folder}")
-        return locations
+        return
     
     # Scan for Reps
-    for rep_folder in sorted(root_path.iterdir()):
-        if not rep_folder.is_dir() or not rep_folder.name.startswith('Rep'):
-            continue
-        
-        rep = rep_folder.name
+    rep_entries = [
+        entry for entry in _subdirs(root_folder)
+        if entry.name.startswith('Rep')
+    ]
+    
+    rep_visited = [[] for _ in rep_entries] if visited is not None else [None] * len(rep_entries)
+    
+    # Rep subtrees are independent; on network drives the listings are
+    # latency-bound, so scan them concurrently when there are several.
+    # Reps are still yielded in listing order, each once it is done.
+    if len(rep_entries) > PARALLEL_REP_SCAN_MIN:
+        with ThreadPoolExecutor(max_workers=min(MAX_REP_SCAN_WORKERS, len(rep_entries))) as executor:
+            futures = [
+                executor.submit(_scan_rep, entry, folders)
+                for entry, folders in zip(rep_entries, rep_visited)
+            ]
+            for future in futures:
+                yield from future.result()
+    else:
+        for rep_entry, folders in zip(rep_entries, rep_visited):
+            yield from _iter_rep(rep_entry, folders)
+    
+    if visited is not None:
+        visited.append(root_folder)
+        visited.extend(chain.from_iterable(rep_visited))
+
+
+def _scan_rep(rep_entry: os.DirEntry, visited: Optional[List[str]] = None) -> List[Location]:
+    """Scan a single Rep folder into a list (for running on a worker thread)."""
+    return list(_iter_rep(rep_entry, visited))
+
+
+def _iter_rep(rep_entry: os.DirEntry, visited: Optional[List[str]] = None) -> Iterator[Location]:
+    """
+    Yield the locations of a single Rep folder in directory listing order.
+    
+    Args:
+        rep_entry: Directory entry of the Rep folder
+        visited: Optional list that collects every folder listed
+    """
+    rep = rep_entry.name
+    folders = visited if visited is not None else []
+    folders.append(rep_entry.path)
+    
+    # Scan for timepoints
+    for timepoint_entry in _subdirs(rep_entry.path):
+        timepoint = timepoint_entry.name
+        folders.append(timepoint_entry.path)
         
-        # Scan for timepoints
-        for timepoint_folder in sorted(rep_folder.iterdir()):
-            if not timepoint_folder.is_dir():
-                continue
-            
-            timepoint = timepoint_folder.name
+        # Scan for datatypes
+        for datatype_entry in _subdirs(timepoint_entry.path):
+            datatype = datatype_entry.name
+            folders.append(datatype_entry.path)
             
-            # Scan for datatypes
-            for datatype_folder in sorted(timepoint_folder.iterdir()):
-                if not datatype_folder.is_dir():
-                    continue
-                
-                datatype = datatype_folder.name
+            # Scan for locations
+            for location_entry in _subdirs(datatype_entry.path):
+                location = location_entry.name
+                folders.append(location_entry.path)
                 
-                # Scan for locations
-                for location_folder in sorted(datatype_folder.iterdir()):
-                    if not location_folder.is_dir():
-                        continue
-                    
-                    location = location_folder.name
-                    
-                    # Check if this is a valid location folder
-                    # Valid locations should have subfolders or tif files
-                    has_content = any(location_folder.iterdir())
-                    
-                    if has_content:
-                        locations.append({
-                            'rep': rep,
-                            'timepoint': timepoint,
-                            'datatype': datatype,
-                            'location': clean_location_name(location),  # Remove '_cropped' suffix if present
-                            'path': str(location_folder)
-                        })
+                # Check if this is a valid location folder
+                # Valid locations should have subfolders or tif files
+                if _has_entries(location_entry.path):
+                    yield Location(
+                        rep=rep,
+                        timepoint=timepoint,
+                        datatype=datatype,
+                        location=clean_location_name(location),  # Remove '_cropped' suffix if present
+                        path=location_entry.path
+                    )
+
+
+def _load_scan_manifest(root_folder: str) -> Optional[List[Location]]:
+    """
+    Load cached scan results if no scanned folder has changed since.
     
-    return locations
+    Returns:
+        Cached location list, or None if the manifest is missing or stale
+    """
+    manifest_path = os.path.join(root_folder, SCAN_MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        for folder, mtime_ns in manifest['folders'].items():
+            if os.stat(folder).st_mtime_ns != mtime_ns:
+                return None
+        return [Location(**loc) for loc in manifest['locations']]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _save_scan_manifest(root_folder: str, locations: List[Location], folders: List[str]):
+    """Write scan results together with the mtimes of all scanned folders."""
+    manifest_path = os.path.join(root_folder, SCAN_MANIFEST_NAME)
+    try:
+        manifest = {
+            'folders': {folder: os.stat(folder).st_mtime_ns for folder in folders},
+            'locations': [loc._asdict() for loc in locations]
+        }
+        mtimes = manifest['folders']
+        
+        def record_root_mtime(mtime_ns: int) -> bool:
+            if root_folder not in mtimes or mtimes[root_folder] == mtime_ns:
+                return False
+            mtimes[root_folder] = mtime_ns
+            return True
+        
+        _write_json_refreshing_parent(manifest_path, manifest, root_folder, record_root_mtime)
+    except OSError as e:
+        print(f"⚠ Could not write scan manifest: {e}")
+
+
+def _write_json_refreshing_parent(path: str, data, parent: str, record_mtime: Callable[[int], bool]):
+    """
+    Write a JSON cache file into a folder whose mtime the cache records.
+    
+    Creating the file changes the folder's mtime, which would make the cache
+    stale on its first reuse. record_mtime(new_mtime) stores the folder's new
+    mtime in data and returns True if it differed; the file is then rewritten
+    in place, which leaves the folder's mtime alone.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    
+    if record_mtime(os.stat(parent).st_mtime_ns):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+
+def _has_entries(folder: str) -> bool:
+    """
+    Check whether a folder has at least one entry.
+    
+    Reads only the first directory entry and closes the handle right away.
+    """
+    with os.scandir(folder) as it:
+        try:
+            next(it)
+        except StopIteration:
+            return False
+    return True
 
 
-def find_tracking_results(root_folder: str) -> List[Path]:
+def _subdirs(folder: str) -> List[os.DirEntry]:
+    """
+    List the subdirectories of a folder (unsorted).
+    
+    Uses os.scandir so the directory check comes from the listing itself
+    instead of a separate stat per entry.
+    """
+    with os.scandir(folder) as it:
+        return [entry for entry in it if entry.is_dir()]
+
+
+def _location_sort_key(loc: Location) -> Tuple[str, str, str, str]:
+    """
+    Sort key matching a name-sorted walk (uses the uncleaned folder name).
+    
+    Parts are passed through os.path.normcase so the order matches the old
+    sorted(Path) walk, which compares case-insensitively on Windows.
+    """
+    return tuple(
+        os.path.normcase(part)
+        for part in (loc.rep, loc.timepoint, loc.datatype, os.path.basename(loc.path))
+    )
+
+
+def find_tracking_results(
+    root_folder: str,
+    skip_dirs: Iterable[str] = DEFAULT_SKIP_DIRS,
+    use_cache: bool = False
+) -> List[Path]:
     """
     Find all 'Tracking Result' folders recursively.
     
+    Hidden folders and folders named in skip_dirs are not searched, and the
+    search does not descend into a Tracking Result folder once found.
+    
     Args:
         root_folder: Root folder to search
+        skip_dirs: Folder names to skip
+        use_cache: Reuse/write a listing cache (TRACKING_CACHE_NAME) in the
+            root folder; folders whose modification time is unchanged are
+            not listed again
     
     Returns:
         List of Tracking Result folder paths
     """
+    skip_dirs = frozenset(skip_dirs)
+    
+    if use_cache:
+        return _find_tracking_results_cached(root_folder, skip_dirs)
+    
+    tracking_results = []
+    
+    if not os.path.isdir(root_folder):
+        return tracking_results
+    
+    # os.fwalk (POSIX) lists each folder relative to its parent's open
+    # descriptor instead of resolving the full path every time
+    walk = os.fwalk if hasattr(os, 'fwalk') else os.walk
+    
+    for dirpath, dirnames, *_ in walk(root_folder):
+        if 'Tracking Result' in dirnames:
+            tracking_results.append(Path(dirpath) / 'Tracking Result')
+        
+        # Don't descend into results folders, hidden or skipped folders
+        dirnames[:] = [
+            d for d in dirnames
+            if d != 'Tracking Result' and d not in skip_dirs and not d.startswith('.')
+        ]
+    
+    return tracking_results
+
+
+def _find_tracking_results_cached(root_folder: str, skip_dirs: frozenset) -> List[Path]:
+    """
+    find_tracking_results backed by a per-folder listing cache.
+    
+    A folder's mtime changes whenever an entry is added, removed or renamed
+    directly inside it, so its cached list of subfolders is reused while the
+    mtime matches. Every folder is still stat'ed, but not listed.
+    """
+    cache_path = os.path.join(root_folder, TRACKING_CACHE_NAME)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    
+    new_cache = {}
     tracking_results = []
-    root_path = Path(root_folder)
+    pending = [root_folder]
     
-    for item in root_path.rglob('*'):
-        if item.is_dir() and item.name == 'Tracking Result':
-            tracking_results.append(item)
+    while pending:
+        folder = pending.pop()
+        try:
+            # Stat before listing so a concurrent change invalidates the entry
+            mtime_ns = os.stat(folder).st_mtime_ns
+            cached = cache.get(folder)
+            if isinstance(cached, list) and len(cached) == 3 and cached[0] == mtime_ns:
+                subdirs, linked = cached[1], cached[2]
+            else:
+                # Same symlink policy as the uncached os.fwalk/os.walk search:
+                # symlinked folders are listed but not descended into
+                with os.scandir(folder) as it:
+                    entries = [entry for entry in it if entry.is_dir()]
+                subdirs = [entry.name for entry in entries]
+                linked = [entry.name for entry in entries if entry.is_symlink()]
+        except OSError:
+            continue
+        
+        new_cache[folder] = [mtime_ns, subdirs, linked]
+        
+        if 'Tracking Result' in subdirs:
+            tracking_results.append(Path(folder) / 'Tracking Result')
+        
+        pending.extend(
+            os.path.join(folder, d) for d in reversed(subdirs)
+            if d != 'Tracking Result' and d not in skip_dirs and not d.startswith('.')
+            and d not in linked
+        )
+    
+    def record_root_mtime(mtime_ns: int) -> bool:
+        root_entry = new_cache.get(root_folder)
+        if root_entry is None or root_entry[0] == mtime_ns:
+            return False
+        root_entry[0] = mtime_ns
+        return True
+    
+    try:
+        _write_json_refreshing_parent(cache_path, new_cache, root_folder, record_root_mtime)
+    except OSError as e:
+        print(f"⚠ Could not write tracking results cache: {e}")
     
     return tracking_results
 
@@ -127,8 +428,23 @@ def get_location_identifier(rep: str, timepoint: str, datatype: str, location: s
         Location identifier string (e.g., 'Rep-1_0-24h_10um_B1_2')
     """
     # Replace spaces with hyphens for cleaner naming
-    rep_clean = rep.replace(' ', '-')
-    return f"{rep_clean}_{timepoint}_{datatype}_{location}"
+    return f"{rep.translate(_SPACE_TO_DASH)}_{timepoint}_{datatype}_{location}"
+
+
+def get_location_identifiers(locations: Iterable[Location]) -> List[str]:
+    """
+    Generate location identifier strings for many locations at once.
+    
+    Args:
+        locations: Location records
+    
+    Returns:
+        Identifier strings in the same order (see get_location_identifier)
+    """
+    return [
+        f"{loc.rep.translate(_SPACE_TO_DASH)}_{loc.timepoint}_{loc.datatype}_{loc.location}"
+        for loc in locations
+    ]
 
 
 def ensure_folder_exists(folder_path: str) -> bool:
@@ -141,31 +457,96 @@ def ensure_folder_exists(folder_path: str) -> bool:
     Returns:
         True if folder exists or was created successfully
     """
+    key = os.path.normpath(folder_path)
+    if key in _ensured and os.path.isdir(key):
+        return True
+    
     try:
         Path(folder_path).mkdir(parents=True, exist_ok=True)
+        _ensured.add(key)
         return True
     except Exception as e:
         print(f"✗ Failed to create folder {folder_path}: {e}")
         return False
 
 
-def find_files_by_pattern(folder: str, pattern: str) -> List[Path]:
+def ensure_folders_exist(folder_paths: Iterable[str]) -> Dict[str, bool]:
+    """
+    Ensure many folders exist, creating only the deepest ones.
+    
+    A folder that is the parent of another requested folder is created as a
+    side effect of creating the child, so only leaf folders are passed to
+    os.makedirs.
+    
+    Args:
+        folder_paths: Paths to folders
+    
+    Returns:
+        Dictionary mapping each given path to True if it exists afterwards
+    """
+    folder_paths = list(folder_paths)
+    normalized = {path: os.path.normpath(path) for path in folder_paths}
+    
+    # Sorting by path components puts every folder directly before its subfolders
+    unique = sorted(set(normalized.values()), key=lambda p: p.split(os.sep))
+    leaves = [
+        path for path, following in zip(unique, unique[1:] + [None])
+        if following is None or not following.startswith(path.rstrip(os.sep) + os.sep)
+    ]
+    
+    created = {}
+    for path in leaves:
+        created[path] = ensure_folder_exists(path)
+    
+    return {
+        path: created[key] if key in created else os.path.isdir(key)
+        for path, key in normalized.items()
+    }
+
+
+def find_files_by_pattern(
+    folder: str,
+    pattern: str,
+    return_type: Literal['Path', 'str'] = 'Path'
+) -> Union[List[Path], List[str]]:
     """
     Find files matching a pattern in a folder.
     
     Args:
         folder: Folder path
         pattern: File pattern (e.g., '*.tif', '*_Red_*.tif')
+        return_type: 'Path' for Path objects, or 'str' for plain path strings
+            (skips building a Path per match)
     
     Returns:
-        List of matching file paths
+        List of matching file paths, sorted
     """
-    folder_path = Path(folder)
-    
-    if not folder_path.exists():
+    if not os.path.exists(folder):
         return []
     
-    return sorted(folder_path.glob(pattern))
+    # Patterns spanning subfolders still go through pathlib
+    if '/' in pattern or os.sep in pattern or '**' in pattern:
+        matches = sorted(Path(folder).glob(pattern))
+        return matches if return_type == 'Path' else [str(p) for p in matches]
+    
+    matcher = _compile_glob(pattern)
+    with os.scandir(folder) as it:
+        matches = [entry.path for entry in it if matcher(entry.name)]
+    
+    if return_type == 'Path':
+        return sorted(map(Path, matches))
+    return sorted(matches)
+
+
+@lru_cache(maxsize=128)
+def _compile_glob(pattern: str):
+    """
+    Compile a single-level glob pattern into a name matcher.
+    
+    Case handling follows pathlib (case-insensitive on Windows).
+    """
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile(fnmatch.translate(pattern), flags).match
 
 
 def get_relative_path(full_path: str, base_path: str) -> str:
@@ -179,10 +560,21 @@ def get_relative_path(full_path: str, base_path: str) -> str:
     Returns:
         Relative path string
     """
-    try:
-        return str(Path(full_path).relative_to(Path(base_path)))
-    except ValueError:
-        return full_path
+    full = os.path.normpath(full_path)
+    base = os.path.normpath(base_path)
+    
+    # Compare case-insensitively where the filesystem does (Windows)
+    full_key = os.path.normcase(full)
+    base_key = os.path.normcase(base)
+    
+    if full_key == base_key:
+        return '.'
+    
+    prefix = base_key if base_key.endswith(os.sep) else base_key + os.sep
+    if full_key.startswith(prefix):
+        return full[len(prefix):]
+    
+    return full_path
 
 
 def validate_location_structure(location_path: str, channel_names: List[str]) -> Tuple[bool, str]:
@@ -196,13 +588,20 @@ def validate_location_structure(location_path: str, channel_names: List[str]) ->
     Returns:
         Tuple of (is_valid, message)
     """
-    location_path_obj = Path(location_path)
-    location_name = clean_location_name(location_path_obj.name)  # Remove '_cropped' suffix if present
+    location_name = clean_location_name(os.path.basename(os.path.normpath(location_path)))  # Remove '_cropped' suffix if present
+    
+    # List the location once and check channel subfolders against the names
+    try:
+        with os.scandir(location_path) as it:
+            subfolders = {entry.name for entry in it if entry.is_dir()}
+    except FileNotFoundError:
+        subfolders = set()
+    except OSError as e:
+        return False, f"Cannot read location folder: {e}"
     
-    # Check for channel subfolders
     for channel in channel_names:
-        channel_folder = location_path_obj / f"{location_name}_{channel}"
-        if not channel_folder.exists():
-            return False, f"Missing channel folder: {channel_folder.name}"
+        channel_folder_name = f"{location_name}_{channel}"
+        if channel_folder_name not in subfolders:
+            return False, f"Missing channel folder: {channel_folder_name}"
     
     return True, "Valid structure"
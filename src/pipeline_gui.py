@@ -7,21 +7,92 @@ Author: Oriana Chen
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
+import logging
+import logging.handlers
 from pathlib import Path
+from typing import Tuple
 import json
+import re
 
 # Add src folder to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config_manager import ConfigManager
 from folder_utils import scan_data_folder_structure
-from channel_splitter import ChannelSplitter
-from segmentation import Segmentator
-from fluorescence_analyzer import FluorescenceAnalyzer
-from subtrack_lineage_analysis import batch_analyze_all_locations
-from tracking_output_relocator import TrackingOutputRelocator
+# Step modules (numpy/pandas/scipy/tifffile) are imported when their step runs,
+# so the window opens without paying for the scientific stack
+
+# Upper bound on threads used to stat location folders during verification
+VERIFY_MAX_WORKERS = 32
+
+# Log widget refresh: poll interval and max lines inserted per refresh
+LOG_DRAIN_INTERVAL_MS = 100
+LOG_DRAIN_MAX_LINES = 2000
+
+# Once the log widget exceeds LOG_MAX_LINES, the oldest LOG_TRIM_LINES are dropped
+LOG_MAX_LINES = 20000
+LOG_TRIM_LINES = 5000
+
+# Lines copied out of the log widget per write when saving
+LOG_SAVE_BLOCK_LINES = 1000
+
+# Example settings in three_channel_stabilize_bulk.txt that get replaced with
+# the scanned project's values
+_MACRO_ROOT_LINE = 'root = "D:/Lammerding Lab/Final Tracking Data/";'
+_MACRO_REPS_LINE = 'reps = newArray("Rep 1", "Rep 3", "Rep 4");'
+_MACRO_TIMES_LINE = 'times = newArray("0-24h", "24-48h", "48-72h", "72-96h");'
+_MACRO_TYPES_LINE = 'types = newArray("Dense", "5um", "10um");'
+_MACRO_PLACEHOLDER_RE = re.compile('|'.join(map(re.escape, (
+    _MACRO_ROOT_LINE, _MACRO_REPS_LINE, _MACRO_TIMES_LINE, _MACRO_TYPES_LINE))))
+
+# How long success toasts stay on screen
+TOAST_DURATION_MS = 2000
+
+# Step status labels and log level prefixes
+_STATUS_LABELS = {
+    "running": "⏳ Running...",
+    "success": "✅ Complete",
+    "error": "❌ Failed",
+    "manual": "👉 Manual Action",
+}
+# Loggers of the step modules that follow the Verbosity setting; the root logger
+# stays at INFO so third-party libraries (e.g. numba) never flood the log at DEBUG
+_PIPELINE_LOGGERS = (
+    'channel_splitter', 'segmentation', 'tracking_output_relocator',
+    'subtrack_lineage_analysis', 'fluorescence_analyzer',
+)
+
+# Numeric level of each GUI log level, used for the verbosity threshold
+_LEVEL_ORDER = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "SUCCESS": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+_LOG_PREFIX = {
+    "INFO": "ℹ️",
+    "SUCCESS": "✅",
+    "ERROR": "❌",
+    "WARNING": "⚠️",
+}
+
+
+class _QueueLogHandler(logging.handlers.QueueHandler):
+    """Logging handler that forwards records to the GUI log queue as (message, level)."""
+    
+    def enqueue(self, record):
+        if record.levelno >= logging.ERROR:
+            level = "ERROR"
+        elif record.levelno >= logging.WARNING:
+            level = "WARNING"
+        else:
+            level = "INFO"
+        self.queue.put_nowait((record.getMessage(), level))
 
 
 class PipelineGUI:
@@ -39,9 +110,42 @@ class PipelineGUI:
         self.current_step = 0
         self.processing = False
         
+        # Log messages from any thread; drained into the log widget by the Tk loop
+        self._log_queue = queue.Queue()
+        # Messages below the threshold are dropped before they reach the queue
+        self._log_threshold = _LEVEL_ORDER['INFO']
+        self._log_handler = _QueueLogHandler(self._log_queue)
+        root_logger = logging.getLogger()
+        root_logger.addHandler(self._log_handler)
+        root_logger.setLevel(logging.INFO)
+        
+        # Location folder contents keyed by path -> ((folder, Tracking Result) mtime_ns, contents)
+        self._loc_cache = {}
+        
+        # Stabilization macro template as (path, mtime_ns, text)
+        self._macro_template = None
+        
+        # Step workers reused across runs (the StarDist model stays loaded)
+        self._splitter = None
+        self._splitter_key = None
+        self._segmentator = None
+        
+        # Steps and scans run one at a time on a single daemon worker thread, so
+        # a running step never keeps the process alive after the window closes.
+        # Queue entries are (stop generation at submission, task); a stop bumps
+        # the generation, so steps queued before it are dropped.
+        self._tasks = queue.Queue()
+        self._task_running = False
+        self._stop_flag = threading.Event()
+        self._stop_lock = threading.Lock()
+        self._stop_generation = 0
+        threading.Thread(target=self._worker_loop, name='pipeline', daemon=True).start()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        
         # Setup GUI
         self._create_widgets()
         self._load_config_if_exists()
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
     
     def _create_widgets(self):
         """Create all GUI widgets."""
@@ -114,6 +218,7 @@ class PipelineGUI:
         ttk.Label(self.config_tab, text="StarDist Model Path:").grid(
             row=row, column=0, sticky=tk.W, pady=5)
         self.model_path_var = tk.StringVar()
+        self.model_path_var.trace_add('write', lambda *_: setattr(self, '_segmentator', None))
         ttk.Entry(self.config_tab, textvariable=self.model_path_var, width=60).grid(
             row=row, column=1, padx=5, pady=5)
         ttk.Button(self.config_tab, text="Browse...", 
@@ -195,22 +300,6 @@ class PipelineGUI:
         steps_frame = ttk.LabelFrame(self.pipeline_tab, text="Pipeline Steps", padding="10")
         steps_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        # Create a canvas with scrollbar
-        canvas = tk.Canvas(steps_frame, height=400)
-        scrollbar = ttk.Scrollbar(steps_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
         # Define pipeline steps
         self.steps = [
             ("1️⃣ Channel Splitting", "Automated", self._run_step1),
@@ -225,24 +314,30 @@ class PipelineGUI:
         self.step_buttons = []
         self.step_status_vars = []
         
+        # One grid row per step; the method column absorbs extra width
+        steps_frame.columnconfigure(1, weight=1)
+        
         for i, (name, method, func) in enumerate(self.steps):
-            step_frame = ttk.Frame(scrollable_frame)
-            step_frame.pack(fill=tk.X, pady=5, padx=5)
-            
             # Step label
-            ttk.Label(step_frame, text=name, font=('Arial', 10, 'bold')).pack(side=tk.LEFT)
-            ttk.Label(step_frame, text=f"({method})", 
-                     font=('Arial', 9), foreground='gray').pack(side=tk.LEFT, padx=5)
+            ttk.Label(steps_frame, text=name, font=('Arial', 10, 'bold')).grid(
+                row=i, column=0, sticky=tk.W, padx=5, pady=5)
+            ttk.Label(steps_frame, text=f"({method})", 
+                     font=('Arial', 9), foreground='gray').grid(row=i, column=1, sticky=tk.W, padx=5)
+            
+            # Button - all steps enabled for flexible execution
+            btn = ttk.Button(steps_frame, text="▶️ Run", command=func)
+            btn.grid(row=i, column=2, sticky=tk.E)
+            self.step_buttons.append(btn)
             
             # Status
             status_var = tk.StringVar(value="⏸️ Pending")
             self.step_status_vars.append(status_var)
-            ttk.Label(step_frame, textvariable=status_var).pack(side=tk.RIGHT, padx=10)
-            
-            # Button - all steps enabled for flexible execution
-            btn = ttk.Button(step_frame, text="▶️ Run", command=func)
-            btn.pack(side=tk.RIGHT)
-            self.step_buttons.append(btn)
+            ttk.Label(steps_frame, textvariable=status_var, width=18).grid(
+                row=i, column=3, sticky=tk.W, padx=10)
+        
+        # Progress of the running batch step (updated from the log queue)
+        self.progress = ttk.Progressbar(self.pipeline_tab, maximum=100, mode='determinate')
+        self.progress.pack(fill=tk.X, padx=5, pady=(5, 0))
         
         # Control buttons
         control_frame = ttk.Frame(self.pipeline_tab)
@@ -269,23 +364,92 @@ class PipelineGUI:
                   command=lambda: self.log_text.delete(1.0, tk.END)).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Save Log", 
                   command=self._save_log).pack(side=tk.LEFT, padx=5)
+        
+        # Verbosity (also applied to module loggers)
+        self.log_level_var = tk.StringVar(value='INFO')
+        ttk.Combobox(button_frame, textvariable=self.log_level_var, width=10, state='readonly',
+                     values=['DEBUG', 'INFO', 'WARNING', 'ERROR']).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(button_frame, text="Verbosity:").pack(side=tk.RIGHT)
+        self.log_level_var.trace_add('write', lambda *_: self._set_log_level(self.log_level_var.get()))
     
     def log(self, message, level="INFO"):
-        """Add message to log."""
-        timestamp = ""
-        prefix = ""
-        if level == "INFO":
-            prefix = "ℹ️"
-        elif level == "SUCCESS":
-            prefix = "✅"
-        elif level == "ERROR":
-            prefix = "❌"
-        elif level == "WARNING":
-            prefix = "⚠️"
-        
-        self.log_text.insert(tk.END, f"{prefix} {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """Add message to log (safe to call from worker threads)."""
+        if _LEVEL_ORDER.get(level, logging.INFO) < self._log_threshold:
+            return
+        self._log_queue.put((message, level))
+    
+    def _set_log_level(self, level):
+        """Apply a verbosity level to GUI messages and the pipeline's module loggers."""
+        self._log_threshold = _LEVEL_ORDER[level]
+        self._log_handler.setLevel(self._log_threshold)
+        for name in _PIPELINE_LOGGERS:
+            logging.getLogger(name).setLevel(self._log_threshold)
+    
+    def _toast(self, message, duration=TOAST_DURATION_MS):
+        """
+        Show a short-lived, non-blocking confirmation near the bottom of the window.
+        
+        Args:
+            message: Text to display
+            duration: Milliseconds before the toast closes itself
+        """
+        toast = tk.Toplevel(self.root)
+        toast.overrideredirect(True)
+        toast.attributes('-topmost', True)
+        ttk.Label(toast, text=f"✅ {message}", padding=(12, 8),
+                  relief=tk.SOLID, borderwidth=1, background='#f0fff0').pack()
+        
+        toast.update_idletasks()
+        x = self.root.winfo_rootx() + self.root.winfo_width() - toast.winfo_reqwidth() - 20
+        y = self.root.winfo_rooty() + self.root.winfo_height() - toast.winfo_reqheight() - 20
+        toast.geometry(f"+{x}+{y}")
+        self.root.after(duration, toast.destroy)
+    
+    def _report_progress(self, done, total):
+        """Progress callback for batch steps (safe to call from worker threads)."""
+        self._log_queue.put((100.0 * done / total if total else 0.0, "PROGRESS"))
+    
+    def _drain_log_queue(self):
+        """Periodically move queued log messages into the log widget."""
+        self._flush_log_queue()
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
+    
+    def _flush_log_queue(self):
+        """Move queued log messages into the log widget in one insert (Tk thread only)."""
+        lines = []
+        try:
+            while len(lines) < LOG_DRAIN_MAX_LINES:
+                message, level = self._log_queue.get_nowait()
+                if level == "PROGRESS":
+                    self.progress['value'] = message
+                    continue
+                lines.append(self._format_log_line(message, level))
+        except queue.Empty:
+            pass
+        
+        if lines:
+            # Tk redraws on its own once we return to the event loop
+            self.log_text.insert(tk.END, "".join(lines))
+            
+            # Trim the oldest lines so the Text widget never grows without bound
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_MAX_LINES:
+                self.log_text.delete('1.0', f'{LOG_TRIM_LINES + 1}.0')
+            self.log_text.see(tk.END)
+    
+    def _force_redraw(self):
+        """Show pending log lines and status changes now instead of at the next drain."""
+        def redraw():
+            self._flush_log_queue()
+            self.root.update_idletasks()
+        
+        # Runs on the Tk thread even when requested from a worker
+        self.root.after(0, redraw)
+    
+    @staticmethod
+    def _format_log_line(message, level):
+        """Format a log message with its level prefix."""
+        return f"{_LOG_PREFIX.get(level, '')} {message}\n"
     
     def _browse_input_folder(self):
         """Browse for input folder."""
@@ -325,7 +489,7 @@ class PipelineGUI:
             if file_path:
                 self.config.save_config(file_path)
                 self.log(f"Config saved to: {file_path}", "SUCCESS")
-                messagebox.showinfo("Success", "Configuration saved!")
+                self._toast("Configuration saved!")
         except Exception as e:
             self.log(f"Failed to save config: {e}", "ERROR")
             messagebox.showerror("Error", f"Failed to save config: {e}")
@@ -341,7 +505,7 @@ class PipelineGUI:
                 self.config.load_config(file_path)
                 self._update_gui_from_config()
                 self.log(f"Config loaded: {file_path}", "SUCCESS")
-                messagebox.showinfo("Success", "Configuration loaded!")
+                self._toast("Configuration loaded!")
             except Exception as e:
                 self.log(f"Failed to load config: {e}", "ERROR")
                 messagebox.showerror("Error", f"Failed to load config: {e}")
@@ -350,12 +514,14 @@ class PipelineGUI:
         """Load config if default file exists."""
         default_path = Path("pipeline_config.json")
         if default_path.exists():
+            if self.config.is_loaded(default_path):
+                return
             try:
-                self.config.load_config(str(default_path))
+                self.config.load_config(default_path)
                 self._update_gui_from_config()
                 self.log("Loaded default configuration", "INFO")
-            except:
-                pass
+            except (OSError, ValueError, TypeError, tk.TclError) as e:
+                self.log(f"Could not load default configuration: {e}", "WARNING")
     
     def _update_gui_from_config(self):
         """Update GUI fields from config."""
@@ -403,7 +569,7 @@ class PipelineGUI:
                 # Setup working directories
                 self.config.setup_working_directories()
                 self.log("Configuration validated successfully!", "SUCCESS")
-                messagebox.showinfo("Success", "Configuration is valid!\nWorking directories created.")
+                self._toast("Configuration is valid!\nWorking directories created.")
                 
         except Exception as e:
             self.log(f"Validation error: {e}", "ERROR")
@@ -420,7 +586,9 @@ class PipelineGUI:
                     self.log("Invalid input folder", "ERROR")
                     return
                 
-                self.locations = scan_data_folder_structure(input_folder)
+                # The scan manifest is reused only while every scanned folder keeps
+                # its mtime, so adding or removing a location still triggers a walk
+                self.locations = scan_data_folder_structure(input_folder, use_cache=True)
                 
                 if self.locations:
                     self.location_count_var.set(f"{len(self.locations)} locations")
@@ -430,7 +598,7 @@ class PipelineGUI:
                     # Show sample
                     self.log("Sample locations:", "INFO")
                     for i, loc in enumerate(self.locations[:5]):
-                        self.log(f"  {i+1}. {loc['rep']}/{loc['timepoint']}/{loc['datatype']}/{loc['location']}", "INFO")
+                        self.log(f"  {i+1}. {loc.rep}/{loc.timepoint}/{loc.datatype}/{loc.location}", "INFO")
                     if len(self.locations) > 5:
                         self.log(f"  ... and {len(self.locations) - 5} more", "INFO")
                 else:
@@ -441,21 +609,19 @@ class PipelineGUI:
             except Exception as e:
                 self.log(f"Scan failed: {e}", "ERROR")
         
-        threading.Thread(target=scan, daemon=True).start()
+        self._submit(scan)
     
     def _update_step_status(self, step_idx, status, message=""):
         """Update step status."""
-        if status == "running":
-            self.step_status_vars[step_idx].set("⏳ Running...")
-        elif status == "success":
-            self.step_status_vars[step_idx].set("✅ Complete")
-        elif status == "error":
-            self.step_status_vars[step_idx].set("❌ Failed")
-        elif status == "manual":
-            self.step_status_vars[step_idx].set("👉 Manual Action")
+        label = _STATUS_LABELS.get(status)
+        if label is not None:
+            self.step_status_vars[step_idx].set(label)
         
         if message:
             self.log(message, "SUCCESS" if status == "success" else "ERROR" if status == "error" else "INFO")
+        
+        if status == "success":
+            self._force_redraw()
     
     def _enable_next_step(self, step_idx):
         """Enable next step button."""
@@ -478,20 +644,12 @@ class PipelineGUI:
                     return
                 
                 channel_names = self.config.get_channel_names()
-                splitter = ChannelSplitter(channel_names)
-                
-                # Redirect output
-                import io
-                from contextlib import redirect_stdout
+                splitter = self._get_splitter(channel_names)
                 
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    stats = splitter.batch_split(self.locations)
-                
-                output = f.getvalue()
-                for line in output.split('\n'):
-                    if line.strip():
-                        self.log(line, "INFO")
+                # Module log records reach the log widget through the queue handler
+                self._report_progress(0, len(self.locations))
+                stats = splitter.batch_split(self.locations, stop_event=self._stop_flag,
+                                             progress_cb=self._report_progress)
                 
                 if stats['success'] > 0:
                     self._update_step_status(0, "success", f"✓ Step 1 Complete: {stats['success']}/{stats['total']} successful")
@@ -502,7 +660,23 @@ class PipelineGUI:
                 self.log(f"Step 1 Error: {e}", "ERROR")
                 self._update_step_status(0, "error")
         
-        threading.Thread(target=run, daemon=True).start()
+        self._submit(run)
+    
+    def _get_splitter(self, channel_names):
+        """Return the ChannelSplitter for these channel names, reusing the previous one."""
+        key = tuple(channel_names)
+        if self._splitter is None or self._splitter_key != key:
+            from channel_splitter import ChannelSplitter
+            self._splitter = ChannelSplitter(list(channel_names))
+            self._splitter_key = key
+        return self._splitter
+    
+    def _get_segmentator(self, model_path):
+        """Return the Segmentator for model_path, keeping a loaded model across runs."""
+        if self._segmentator is None or self._segmentator.model_path != model_path:
+            from segmentation import Segmentator
+            self._segmentator = Segmentator(model_path)
+        return self._segmentator
     
     def _run_step2(self):
         """Run step 2: Generate stabilization macro."""
@@ -551,13 +725,12 @@ The pipeline will automatically check if all stabilized files were generated.
         """
         ttk.Label(dialog, text=msg, justify=tk.LEFT).pack(pady=10, padx=20)
         
-        def verify():
-            verified = self._verify_stabilization()
+        def on_verified(verified):
             if verified['success'] == verified['total']:
                 self.log(f"✓ Verification passed: {verified['success']}/{verified['total']} locations", "SUCCESS")
                 self._update_step_status(1, "success", "Step 2 Complete")
                 dialog.destroy()
-                messagebox.showinfo("Success", f"Verification passed!\n{verified['success']}/{verified['total']} locations complete")
+                self._toast(f"Verification passed!\n{verified['success']}/{verified['total']} locations complete")
             else:
                 self.log(f"⚠ Verification found issues: {verified['missing']}/{verified['total']} locations missing files", "WARNING")
                 result = messagebox.askyesno("Verification Failed", 
@@ -566,7 +739,10 @@ The pipeline will automatically check if all stabilized files were generated.
                     self._update_step_status(1, "success", "Step 2 Complete (partial)")
                     dialog.destroy()
         
-        ttk.Button(dialog, text="✓ Verify Results", command=verify).pack(pady=10)
+        verify_btn = ttk.Button(dialog, text="✓ Verify Results",
+                                command=lambda: self._start_verification(
+                                    dialog, verify_btn, self._verify_stabilization, on_verified))
+        verify_btn.pack(pady=10)
         ttk.Button(dialog, text="⏸️ Verify Later", command=dialog.destroy).pack()
     
     def _run_step3(self):
@@ -582,23 +758,17 @@ The pipeline will automatically check if all stabilized files were generated.
                     return
                 
                 working_dir = self.config.get('working_directory')
-                input_mask_folder = str(Path(working_dir) / "InputMask")
+                input_mask_folder = Path(working_dir) / "InputMask"
                 
                 # Use original locations (in-place processing)
                 # No need to update paths as they already point to input data folder
-                segmentator = Segmentator(model_path)
-                
-                import io
-                from contextlib import redirect_stdout
+                segmentator = self._get_segmentator(model_path)
                 
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    stats = segmentator.batch_segment(self.locations, input_mask_folder)
-                
-                output = f.getvalue()
-                for line in output.split('\n'):
-                    if line.strip():
-                        self.log(line, "INFO")
+                # Module log records reach the log widget through the queue handler
+                self._report_progress(0, len(self.locations))
+                stats = segmentator.batch_segment(self.locations, input_mask_folder,
+                                                  stop_event=self._stop_flag,
+                                                  progress_cb=self._report_progress)
                 
                 if stats['success'] > 0:
                     self._update_step_status(2, "success", f"✓ Step 3 Complete: {stats['success']}/{stats['total']} successful")
@@ -611,7 +781,7 @@ The pipeline will automatically check if all stabilized files were generated.
                 self.log(traceback.format_exc(), "ERROR")
                 self._update_step_status(2, "error")
         
-        threading.Thread(target=run, daemon=True).start()
+        self._submit(run)
     
     def _run_step4(self):
         """Run step 4: Verify TrackMate tracking."""
@@ -652,13 +822,12 @@ The pipeline will automatically check if all CSV files have been exported.
         """
         ttk.Label(dialog, text=msg, justify=tk.LEFT).pack(pady=10, padx=20)
         
-        def verify():
-            verified = self._verify_trackmate()
+        def on_verified(verified):
             if verified['success'] == verified['total']:
                 self.log(f"✓ Verification passed: {verified['success']}/{verified['total']} locations", "SUCCESS")
                 self._update_step_status(3, "success", "Step 4 Complete")
                 dialog.destroy()
-                messagebox.showinfo("Success", f"Verification passed!\n{verified['success']}/{verified['total']} locations complete")
+                self._toast(f"Verification passed!\n{verified['success']}/{verified['total']} locations complete")
             else:
                 self.log(f"⚠ Verification found issues: {verified['missing']}/{verified['total']} locations missing data", "WARNING")
                 result = messagebox.askyesno("Verification Failed", 
@@ -667,7 +836,10 @@ The pipeline will automatically check if all CSV files have been exported.
                     self._update_step_status(3, "success", "Step 4 Complete (partial)")
                     dialog.destroy()
         
-        ttk.Button(dialog, text="✓ Verify Results", command=verify).pack(pady=10)
+        verify_btn = ttk.Button(dialog, text="✓ Verify Results",
+                                command=lambda: self._start_verification(
+                                    dialog, verify_btn, self._verify_trackmate, on_verified))
+        verify_btn.pack(pady=10)
         ttk.Button(dialog, text="⏸️ Verify Later", command=dialog.destroy).pack()
     
     def _run_step4_5(self):
@@ -714,19 +886,11 @@ The pipeline will automatically check if all CSV files have been exported.
                 self.log(f"Target: {input_data_folder}", "INFO")
                 self.log("", "INFO")
                 
-                import io
-                from contextlib import redirect_stdout
+                from tracking_output_relocator import TrackingOutputRelocator
                 
+                # Module log records stream to the log widget through the queue handler
                 relocator = TrackingOutputRelocator(str(output_tracks), input_data_folder)
-                
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    stats = relocator.relocate_all()
-                
-                output = f.getvalue()
-                for line in output.split('\n'):
-                    if line.strip():
-                        self.log(line, "INFO")
+                stats = relocator.relocate_all(stop_event=self._stop_flag)
                 
                 if stats['moved'] > 0:
                     self._update_step_status(4, "success", 
@@ -741,7 +905,7 @@ The pipeline will automatically check if all CSV files have been exported.
                 self.log(f"Step 4.5 Error: {e}", "ERROR")
                 self._update_step_status(4, "error")
         
-        threading.Thread(target=run, daemon=True).start()
+        self._submit(run)
     
     def _run_step5(self):
         """Run step 5: Subtrack Analysis."""
@@ -754,21 +918,15 @@ The pipeline will automatically check if all CSV files have been exported.
                 max_splits = self.max_splits_var.get()
                 min_duration = self.min_duration_var.get()
                 
-                import io
-                from contextlib import redirect_stdout
+                from subtrack_lineage_analysis import batch_analyze_all_locations
                 
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    results = batch_analyze_all_locations(
-                        Path(input_data_folder),
-                        max_splits=max_splits,
-                        min_duration=min_duration
-                    )
-                
-                output = f.getvalue()
-                for line in output.split('\n'):
-                    if line.strip():
-                        self.log(line, "INFO")
+                # Module log records stream to the log widget through the queue handler
+                results = batch_analyze_all_locations(
+                    Path(input_data_folder),
+                    max_splits=max_splits,
+                    min_duration=min_duration,
+                    stop_event=self._stop_flag
+                )
                 
                 success_count = sum(1 for v in results.values() if v)
                 if success_count > 0:
@@ -780,7 +938,7 @@ The pipeline will automatically check if all CSV files have been exported.
                 self.log(f"Step 5 Error: {e}", "ERROR")
                 self._update_step_status(5, "error")
         
-        threading.Thread(target=run, daemon=True).start()
+        self._submit(run)
     
     def _run_step6(self):
         """Run step 6: Fluorescence Analysis."""
@@ -789,23 +947,15 @@ The pipeline will automatically check if all CSV files have been exported.
                 self._update_step_status(6, "running", "[Step 6] Starting fluorescence analysis...")
                 
                 working_dir = self.config.get('working_directory')
-                input_mask_folder = str(Path(working_dir) / "InputMask")
+                input_mask_folder = Path(working_dir) / "InputMask"
                 
                 # Use original locations (in-place processing)
                 # Locations already have correct 'path' field pointing to input data folder
+                from fluorescence_analyzer import FluorescenceAnalyzer
                 analyzer = FluorescenceAnalyzer(input_mask_folder)
                 
-                import io
-                from contextlib import redirect_stdout
-                
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    stats = analyzer.batch_analyze(self.locations)
-                
-                output = f.getvalue()
-                for line in output.split('\n'):
-                    if line.strip():
-                        self.log(line, "INFO")
+                # Module log records stream to the log widget through the queue handler
+                stats = analyzer.batch_analyze(self.locations, stop_event=self._stop_flag)
                 
                 if stats['success'] > 0:
                     self._update_step_status(6, "success", f"✓ Step 6 Complete: {stats['success']}/{stats['total']} successful")
@@ -818,7 +968,7 @@ The pipeline will automatically check if all CSV files have been exported.
                 self.log(f"Step 6 Error: {e}", "ERROR")
                 self._update_step_status(6, "error")
         
-        threading.Thread(target=run, daemon=True).start()
+        self._submit(run)
     
     def _run_all_steps(self):
         """Run all pipeline steps."""
@@ -826,17 +976,60 @@ The pipeline will automatically check if all CSV files have been exported.
         # This would need more complex orchestration
         self.log("Please execute each step manually", "INFO")
     
+    def _submit(self, task):
+        """
+        Queue a step on the pipeline worker thread.
+        
+        Args:
+            task: Zero-argument callable to run in the background
+        """
+        if self._task_running or not self._tasks.empty():
+            self.log("Another step is still running; this one will start when it finishes", "INFO")
+        
+        with self._stop_lock:
+            self._tasks.put((self._stop_generation, task))
+    
+    def _worker_loop(self):
+        """Run queued steps one after another (pipeline worker thread)."""
+        while True:
+            generation, task = self._tasks.get()
+            with self._stop_lock:
+                if generation != self._stop_generation:
+                    # Queued before the last stop
+                    continue
+                self._stop_flag.clear()
+                self._task_running = True
+            try:
+                task()
+            except Exception as e:
+                self.log(f"Unexpected error: {e}", "ERROR")
+            finally:
+                self._task_running = False
+    
+    def _request_stop(self):
+        """Signal the running step to stop and drop every queued one."""
+        with self._stop_lock:
+            self._stop_generation += 1
+            self._stop_flag.set()
+    
     def _stop_processing(self):
         """Stop processing."""
         self.processing = False
+        self._request_stop()
         self.log("Processing stopped", "WARNING")
     
+    def _on_close(self):
+        """Signal the running step to stop and close the window."""
+        self._request_stop()
+        self.root.destroy()
+    
     def _reset_pipeline(self):
         """Reset pipeline state."""
         result = messagebox.askyesno("Confirm", "Reset all step statuses?")
         if result:
             for var in self.step_status_vars:
                 var.set("⏸️ Pending")
+            self._loc_cache.clear()
             # All steps remain enabled for flexible execution
             self.log("Pipeline reset", "INFO")
     
@@ -849,8 +1042,11 @@ The pipeline will automatically check if all CSV files have been exported.
         )
         
         if file_path:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(self.log_text.get(1.0, tk.END))
+            # Copy the widget out in blocks rather than one string of the whole log
+            last_line = int(self.log_text.index('end-1c').split('.')[0])
+            with open(file_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                for start in range(1, last_line + 1, LOG_SAVE_BLOCK_LINES):
+                    f.write(self.log_text.get(f'{start}.0', f'{start + LOG_SAVE_BLOCK_LINES}.0'))
             self.log(f"Log saved to: {file_path}", "SUCCESS")
     
     def _generate_stabilization_macro(self):
@@ -869,39 +1065,32 @@ The pipeline will automatically check if all CSV files have been exported.
                 self.log("Warning: Template file not found, generating basic macro", "WARNING")
                 macro_content = self._generate_basic_stabilization_macro()
             else:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    template_content = f.read()
+                template_content = self._read_macro_template(template_path)
                 
                 # Extract unique reps, timepoints, and datatypes from locations
-                reps = sorted(set([loc['rep'] for loc in self.locations]))
-                timepoints = sorted(set([loc['timepoint'] for loc in self.locations]))
-                datatypes = sorted(set([loc['datatype'] for loc in self.locations]))
+                reps, timepoints, datatypes = set(), set(), set()
+                for loc in self.locations:
+                    reps.add(loc.rep)
+                    timepoints.add(loc.timepoint)
+                    datatypes.add(loc.datatype)
                 
                 # Convert to ImageJ array format
-                reps_array = ', '.join([f'"{r}"' for r in reps])
-                times_array = ', '.join([f'"{t}"' for t in timepoints])
-                types_array = ', '.join([f'"{d}"' for d in datatypes])
+                reps_array = ', '.join(f'"{r}"' for r in sorted(reps))
+                times_array = ', '.join(f'"{t}"' for t in sorted(timepoints))
+                types_array = ', '.join(f'"{d}"' for d in sorted(datatypes))
                 
                 # Replace root path (convert to forward slashes for ImageJ)
                 root_path = str(input_folder).replace('\\', '/') + '/'
                 
-                # Replace placeholders in template
-                macro_content = template_content.replace(
-                    'root = "D:/Lammerding Lab/Final Tracking Data/";',
-                    f'root = "{root_path}";'
-                )
-                macro_content = macro_content.replace(
-                    'reps = newArray("Rep 1", "Rep 3", "Rep 4");',
-                    f'reps = newArray({reps_array});'
-                )
-                macro_content = macro_content.replace(
-                    'times = newArray("0-24h", "24-48h", "48-72h", "72-96h");',
-                    f'times = newArray({times_array});'
-                )
-                macro_content = macro_content.replace(
-                    'types = newArray("Dense", "5um", "10um");',
-                    f'types = newArray({types_array});'
-                )
+                # Replace placeholders in template (one pass over the text)
+                replacements = {
+                    _MACRO_ROOT_LINE: f'root = "{root_path}";',
+                    _MACRO_REPS_LINE: f'reps = newArray({reps_array});',
+                    _MACRO_TIMES_LINE: f'times = newArray({times_array});',
+                    _MACRO_TYPES_LINE: f'types = newArray({types_array});',
+                }
+                macro_content = _MACRO_PLACEHOLDER_RE.sub(
+                    lambda m: replacements[m.group(0)], template_content)
             
             # Save macro to working directory
             output_path = working_dir / "image_stabilization_macro.ijm"
@@ -919,6 +1108,17 @@ The pipeline will automatically check if all CSV files have been exported.
             self.log(f"Failed to generate stabilization macro: {e}", "ERROR")
             return None
     
+    def _read_macro_template(self, template_path: Path) -> str:
+        """Return the macro template text, re-reading it only if the file changed."""
+        mtime = template_path.stat().st_mtime_ns
+        cached = self._macro_template
+        if cached is not None and cached[0] == template_path and cached[1] == mtime:
+            return cached[2]
+        
+        text = template_path.read_text(encoding='utf-8')
+        self._macro_template = (template_path, mtime, text)
+        return text
+    
     def _generate_basic_stabilization_macro(self):
         """Generate a basic stabilization macro if template is not available."""
         return """// Basic Image Stabilization Macro
@@ -926,30 +1126,149 @@ print("Image stabilization macro generated by pipeline");
 print("Please configure according to your data structure");
 """
     
+    def _start_verification(self, dialog, button, verify_fn, on_verified):
+        """
+        Run a verification function on a worker thread while the dialog stays responsive.
+        
+        Args:
+            dialog: Verification dialog hosting the progress bar
+            button: Verify button, disabled while the check runs
+            verify_fn: Callable returning the stats dict (runs off the Tk thread)
+            on_verified: Callback receiving the stats dict on the Tk thread
+        """
+        if not self.locations:
+            self.log("Please scan data folder first!", "ERROR")
+            messagebox.showerror("Error", "No locations loaded. Please click 'Scan Data Folder' first.")
+            return
+        
+        button.config(state=tk.DISABLED)
+        progress = ttk.Progressbar(dialog, mode='indeterminate')
+        progress.pack(fill=tk.X, padx=20, pady=5)
+        progress.start(10)
+        
+        results = queue.Queue()
+        threading.Thread(target=lambda: results.put(verify_fn()), daemon=True).start()
+        
+        def poll():
+            try:
+                verified = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            # Dialog closed via "Verify Later" while the check was running
+            if not dialog.winfo_exists():
+                return
+            progress.stop()
+            progress.destroy()
+            button.config(state=tk.NORMAL)
+            on_verified(verified)
+        
+        self.root.after(100, poll)
+    
+    def _scan_location(self, location_path: str):
+        """
+        List the verification-relevant files of a location, cached until its folders change.
+        
+        Args:
+            location_path: Location folder
+            
+        Returns:
+            Dict with 'cropped', 'spots', 'edges', 'tracks' file name lists and a
+            'tracking_result' flag, or None if the location folder does not exist
+        """
+        tracking_result = os.path.join(location_path, "Tracking Result")
+        try:
+            loc_mtime = os.stat(location_path).st_mtime_ns
+        except OSError:
+            return None
+        try:
+            tr_mtime = os.stat(tracking_result).st_mtime_ns
+        except OSError:
+            tr_mtime = None
+        
+        stamp = (loc_mtime, tr_mtime)
+        cached = self._loc_cache.get(location_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        
+        if tr_mtime is not None:
+            spots, edges, tracks = self._classify_tracking_csvs(tracking_result)
+        else:
+            spots, edges, tracks = [], [], []
+        contents = {
+            'cropped': self._cropped_tifs(location_path),
+            'tracking_result': tr_mtime is not None,
+            'spots': spots,
+            'edges': edges,
+            'tracks': tracks,
+        }
+        self._loc_cache[location_path] = (stamp, contents)
+        return contents
+    
+    @staticmethod
+    def _file_names(folder: str) -> list:
+        """List regular file names in a folder with one scandir."""
+        with os.scandir(folder) as entries:
+            return [entry.name for entry in entries if entry.is_file(follow_symlinks=False)]
+    
+    @classmethod
+    def _cropped_tifs(cls, location_path: str) -> list:
+        """List stabilized (cropped) TIFF files in a location folder (glob "*_cropped*.tif")."""
+        # This is a basic check - adjust based on actual file naming
+        cropped = []
+        for name in cls._file_names(location_path):
+            key = name.lower() if os.name == 'nt' else name
+            if key.endswith('.tif') and '_cropped' in key[:-4]:
+                cropped.append(name)
+        return cropped
+    
+    @classmethod
+    def _classify_tracking_csvs(cls, tracking_result: str) -> Tuple[list, list, list]:
+        """
+        Sort the TrackMate CSV exports in a Tracking Result folder in one pass.
+        
+        Args:
+            tracking_result: Tracking Result folder
+            
+        Returns:
+            (spots, edges, tracks) file name lists; "-all-spots.csv" counts as spots
+        """
+        spots, edges, tracks = [], [], []
+        for name in cls._file_names(tracking_result):
+            key = name.lower() if os.name == 'nt' else name
+            if key.endswith('-spots.csv'):
+                spots.append(name)
+            elif key.endswith('-edges.csv'):
+                edges.append(name)
+            elif key.endswith('-tracks.csv'):
+                tracks.append(name)
+        return spots, edges, tracks
+    
+    def _map_locations(self, fn):
+        """Apply fn to every location on a thread pool, preserving location order."""
+        workers = min(VERIFY_MAX_WORKERS, len(self.locations))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, self.locations))
+    
     def _verify_stabilization(self):
-        """Verify that stabilization has been completed for all locations."""
+        """Verify that stabilization has been completed for all locations (worker thread safe)."""
         try:
             # Check if locations have been scanned
             if not self.locations:
                 self.log("Please scan data folder first!", "ERROR")
-                messagebox.showerror("Error", "No locations loaded. Please click 'Scan Data Folder' first.")
                 return {'total': 0, 'success': 0, 'missing': 0}
             
-            input_folder = Path(self.config.get('input_data_folder'))
             stats = {'total': len(self.locations), 'success': 0, 'missing': 0}
             
-            for location in self.locations:
-                location_path = Path(location['path'])
-                
-                # Check for stabilized files (typically have '_stabilized' or similar suffix)
-                # This is a basic check - adjust based on actual file naming
-                stabilized_files = list(location_path.glob("*_cropped*.tif"))
-                
-                if stabilized_files:
+            # Folder checks are I/O bound (slow on network drives), so fan them out
+            results = self._map_locations(lambda loc: self._scan_location(loc.path))
+            
+            for location, contents in zip(self.locations, results):
+                if contents is not None and contents['cropped']:
                     stats['success'] += 1
                 else:
                     stats['missing'] += 1
-                    self.log(f"  Missing stabilized files: {location['name']}", "WARNING")
+                    self.log(f"  Missing stabilized files: {location.location}", "WARNING")
             
             return stats
             
@@ -958,42 +1277,29 @@ print("Please configure according to your data structure");
             return {'total': 0, 'success': 0, 'missing': 0}
     
     def _verify_trackmate(self):
-        """Verify that TrackMate tracking has been completed for all locations."""
+        """Verify that TrackMate tracking has been completed for all locations (worker thread safe)."""
         try:
             # Check if locations have been scanned
             if not self.locations:
                 self.log("Please scan data folder first!", "ERROR")
-                messagebox.showerror("Error", "No locations loaded. Please click 'Scan Data Folder' first.")
                 return {'total': 0, 'success': 0, 'missing': 0}
             
             stats = {'total': len(self.locations), 'success': 0, 'missing': 0}
             
-            for location in self.locations:
-                location_path = Path(location['path'])
-                tracking_result = location_path / "Tracking Result"
-                
-                if not tracking_result.exists():
+            results = self._map_locations(lambda loc: self._scan_location(loc.path))
+            
+            for location, contents in zip(self.locations, results):
+                if contents is None or not contents['tracking_result']:
                     stats['missing'] += 1
-                    self.log(f"  Missing Tracking Result folder: {location['name']}", "WARNING")
+                    self.log(f"  Missing Tracking Result folder: {location.location}", "WARNING")
                     continue
                 
-                # Check for required CSV files
-                spots_files = list(tracking_result.glob("*-spots.csv")) or list(tracking_result.glob("*-all-spots.csv"))
-                edges_files = list(tracking_result.glob("*-edges.csv"))
-                tracks_files = list(tracking_result.glob("*-tracks.csv"))
-                
-                if spots_files and edges_files and tracks_files:
+                missing = [f"{kind}.csv" for kind in ('spots', 'edges', 'tracks') if not contents[kind]]
+                if not missing:
                     stats['success'] += 1
                 else:
                     stats['missing'] += 1
-                    missing = []
-                    if not spots_files:
-                        missing.append("spots.csv")
-                    if not edges_files:
-                        missing.append("edges.csv")
-                    if not tracks_files:
-                        missing.append("tracks.csv")
-                    self.log(f"  Missing files in {location['name']}: {', '.join(missing)}", "WARNING")
+                    self.log(f"  Missing files in {location.location}: {', '.join(missing)}", "WARNING")
             
             return stats
             
@@ -7,13 +7,74 @@ Author: Oriana Chen
 """
 import os
 import gc
-import time
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple, Union
 import numpy as np
 import tifffile
 from tqdm import tqdm
 
+from folder_utils import Location, get_location_identifier
+
+logger = logging.getLogger(__name__)
+
+# Most recently loaded StarDist model as (absolute model path, model); shared by
+# all Segmentator instances so a new instance for the same model skips the reload
+_LOADED_MODEL: Optional[Tuple[str, object]] = None
+
+# Finished mask stacks waiting for the background writer (bounds memory use)
+WRITE_QUEUE_SIZE = 2
+
+# Label masks are mostly background and compress very well; ImageJ (and so
+# TrackMate) reads deflate-compressed TIFFs, and level 1 keeps encoding cheap
+MASK_COMPRESSION = 'zlib'
+MASK_COMPRESSION_LEVEL = 1
+
+# Per-frame percentile normalization before prediction (as csbdeep.utils.normalize)
+NORM_PERCENTILES = (1, 99.8)
+NORM_EPS = np.float32(1e-20)
+
+
+def _normalize_frame(frame: np.ndarray) -> np.ndarray:
+    """
+    Scale a frame to its own percentiles (float32, like csbdeep normalize).
+    
+    Percentiles are taken one frame at a time, so a memory-mapped stack is
+    never copied whole.
+    """
+    lo, hi = np.percentile(frame, NORM_PERCENTILES)
+    lo, hi = np.float32(lo), np.float32(hi)
+    return (frame.astype(np.float32, copy=False) - lo) / (hi - lo + NORM_EPS)
+
+
+def _normalized_frames(stack: np.ndarray) -> Iterator[np.ndarray]:
+    """
+    Yield normalized frames, preparing frame i+1 on a helper thread while i is used.
+    
+    StarDist predicts one image per call, so instead of batching frames this
+    overlaps normalization (and reading the frame) with model inference.
+    
+    Args:
+        stack: Image stack (T, Y, X)
+    
+    Yields:
+        float32 normalized frames in order
+    """
+    n_frames = stack.shape[0]
+    if n_frames == 0:
+        return
+    
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='normalize') as pool:
+        pending = pool.submit(_normalize_frame, stack[0])
+        for i in range(n_frames):
+            frame = pending.result()
+            if i + 1 < n_frames:
+                pending = pool.submit(_normalize_frame, stack[i + 1])
+            yield frame
+
 
 class Segmentator:
     """Handles cell segmentation using StarDist."""
@@ -30,153 +91,274 @@ class Segmentator:
         self.processed_count = 0
         self.failed_files = []
         self.skipped_files = []
+        
+        # Masks are saved on a background thread so the next stack can start
+        self._io_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = None
     
     def load_model(self) -> bool:
         """
-        Load StarDist model.
+        Load StarDist model (no-op if it is already loaded).
         
         Returns:
             True if model loaded successfully
         """
+        global _LOADED_MODEL
+        
+        if self.model is not None:
+            return True
+        
+        model_key = os.path.abspath(self.model_path)
+        if _LOADED_MODEL is not None and _LOADED_MODEL[0] == model_key:
+            self.model = _LOADED_MODEL[1]
+            logger.info("✓ StarDist model already loaded")
+            return True
+        
         try:
             from stardist.models import StarDist2D
-            from csbdeep.utils import normalize
-            
-            self.normalize = normalize
             
             model_name = os.path.basename(self.model_path)
             model_basedir = os.path.dirname(self.model_path)
             
-            print("Loading StarDist model...")
+            logger.info("Loading StarDist model...")
             self.model = StarDist2D(None, name=model_name, basedir=model_basedir)
-            print("✓ StarDist model loaded successfully")
+            _LOADED_MODEL = (model_key, self.model)
+            logger.info("✓ StarDist model loaded successfully")
             return True
             
         except Exception as e:
-            print(f"✗ Failed to load StarDist model: {e}")
+            logger.error(f"✗ Failed to load StarDist model: {e}")
             return False
     
-    def segment_image(self, input_path: str, output_path: str) -> bool:
+    def segment_image(
+        self,
+        input_path: str,
+        output_path: str,
+        stack_future: Optional[Future] = None
+    ) -> bool:
         """
         Segment a single image stack.
         
         Args:
             input_path: Path to input TIFF stack
             output_path: Path to output segmentation mask
+            stack_future: Optional future already reading input_path (prefetch)
+        
+        The mask is handed to the background writer; call wait_for_writes()
+        before relying on the output file.
         
         Returns:
-            True if successful
+            True if segmentation succeeded and the mask was queued for saving
         """
         try:
             # Check if output already exists
             if os.path.exists(output_path):
-                print(f"  ⏩ Skipped (already exists): {os.path.basename(output_path)}")
+                logger.info(f"  ⏩ Skipped (already exists): {os.path.basename(output_path)}")
                 self.skipped_files.append(input_path)
                 return True
             
             # Load image stack
-            print(f"  Loading: {os.path.basename(input_path)}")
-            stack = tifffile.imread(input_path)
+            logger.info(f"  Loading: {os.path.basename(input_path)}")
+            if stack_future is not None:
+                stack = stack_future.result()
+            else:
+                stack = self._read_stack(input_path)
             
-            # Segment each frame
-            segmented_stack = []
-            for i in tqdm(range(stack.shape[0]), desc="  Segmenting frames", leave=False):
-                norm_img = self.normalize(stack[i], 1, 99.8)
+            # Segment each frame; the next frame is normalized while this one predicts
+            # Output is allocated once the first label image fixes the frame shape,
+            # as uint8 while every label fits and widened to uint16 if one doesn't
+            segmented_stack = None
+            frames = _normalized_frames(stack)
+            # Redraw at most ~50 times per stack, and not at all without a terminal (GUI)
+            pbar = tqdm(frames, total=stack.shape[0], desc="  Segmenting frames", leave=False,
+                        mininterval=1.0, miniters=max(1, stack.shape[0] // 50), disable=None)
+            for i, norm_img in enumerate(pbar):
                 labels, _ = self.model.predict_instances(norm_img)
-                segmented_stack.append(labels.astype(np.uint16))
-            
-            segmented_stack = np.stack(segmented_stack, axis=0)
+                max_label = int(labels.max()) if labels.size else 0
+                if segmented_stack is None:
+                    dtype = np.uint8 if max_label <= np.iinfo(np.uint8).max else np.uint16
+                    segmented_stack = np.empty((stack.shape[0],) + labels.shape, dtype=dtype)
+                elif segmented_stack.dtype == np.uint8 and max_label > np.iinfo(np.uint8).max:
+                    segmented_stack = segmented_stack.astype(np.uint16)
+                segmented_stack[i] = labels
             
-            # Save output
-            print(f"  Saving: {os.path.basename(output_path)}")
-            with tifffile.TiffWriter(output_path, imagej=True) as tif:
-                tif.write(segmented_stack, metadata={"axes": "TYX"})
-                tif._fh.flush()
-                os.fsync(tif._fh.fileno())
+            # Save output in the background (blocks only if the writer is behind)
+            logger.info(f"  Saving: {os.path.basename(output_path)}")
+            self._start_writer()
+            self._io_queue.put((input_path, output_path, segmented_stack))
             
-            print(f"  ✓ Segmentation complete")
+            logger.info(f"  ✓ Segmentation complete")
             
             # Cleanup
             del segmented_stack
             del stack
             gc.collect()
-            time.sleep(0.2)
             
-            self.processed_count += 1
             return True
             
         except Exception as e:
-            print(f"  ✗ Segmentation failed: {e}")
+            logger.error(f"  ✗ Segmentation failed: {e}")
             self.failed_files.append((input_path, str(e)))
             return False
     
+    @staticmethod
+    def _read_stack(input_path: str) -> np.ndarray:
+        """
+        Open an input TIFF stack for frame-by-frame reading.
+        
+        Uncompressed stacks are memory-mapped so frames are paged in from the
+        OS cache as they are normalized; compressed stacks (or ones that cannot
+        be mapped) are decoded fully, using several threads across pages.
+        """
+        with tifffile.TiffFile(input_path) as tif:
+            if tif.pages[0].compression == tifffile.COMPRESSION.NONE:
+                try:
+                    return tifffile.memmap(input_path, mode='r')
+                except ValueError:
+                    pass
+            return tif.asarray(maxworkers=max(1, (os.cpu_count() or 1) // 2))
+    
+    def _start_writer(self):
+        """Start the background mask writer thread if it is not running."""
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, daemon=True,
+                                            name='segmentation-writer')
+            self._writer.start()
+    
+    def _write_loop(self):
+        """Save queued mask stacks; a partial file never takes the final name."""
+        while True:
+            input_path, output_path, segmented_stack = self._io_queue.get()
+            temp_path = f"{output_path}.part"
+            try:
+                tifffile.imwrite(temp_path, segmented_stack, imagej=True,
+                                 metadata={"axes": "TYX"},
+                                 compression=MASK_COMPRESSION,
+                                 compressionargs={'level': MASK_COMPRESSION_LEVEL})
+                os.replace(temp_path, output_path)
+                self.processed_count += 1
+            except Exception as e:
+                logger.error(f"  ✗ Saving {os.path.basename(output_path)} failed: {e}")
+                self.failed_files.append((input_path, str(e)))
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+            finally:
+                self._io_queue.task_done()
+    
+    def wait_for_writes(self):
+        """Block until every queued mask stack has been written."""
+        self._io_queue.join()
+    
     def batch_segment(
         self,
-        locations: List[Dict[str, str]],
-        input_mask_folder: str
+        locations: List[Location],
+        input_mask_folder: Union[str, Path],
+        stop_event: Optional[threading.Event] = None,
+        progress_cb: Optional[Callable[[int, int], None]] = None
     ) -> Dict[str, int]:
         """
         Batch segment multiple locations.
         
         Args:
-            locations: List of location dictionaries
+            locations: List of Location records
             input_mask_folder: Output folder for segmentation masks
+            stop_event: Optional event checked before each location; stops the batch once set
+            progress_cb: Optional callback called as progress_cb(done, total) after each location
         
         Returns:
             Dictionary with processing statistics
         """
-        print("\n" + "=" * 80)
-        print("SEGMENTATION")
-        print("=" * 80)
-        
-        if not self.load_model():
-            return {'total': 0, 'success': 0, 'failed': 0, 'skipped': 0}
-        
-        print(f"\nProcessing {len(locations)} locations...")
+        logger.info("=" * 80)
+        logger.info("SEGMENTATION")
+        logger.info("=" * 80)
         
         self.processed_count = 0
         self.failed_files = []
         self.skipped_files = []
         
-        Path(input_mask_folder).mkdir(parents=True, exist_ok=True)
+        mask_folder = Path(input_mask_folder)
+        mask_folder.mkdir(parents=True, exist_ok=True)
         
-        for idx, loc_info in enumerate(locations, 1):
-            location_name = loc_info['location']
-            location_path = Path(loc_info['path'])
+        # Resolve input/output paths up front so the next stack to segment is known
+        plan = []
+        for loc_info in locations:
+            location_name = loc_info.location
             
             # Find Red_Stabilized.tif file
-            red_stabilized_file = location_path / f"{location_name}_Red_Stabilized.tif"
-            
+            red_stabilized_file = Path(loc_info.path) / f"{location_name}_Red_Stabilized.tif"
             if not red_stabilized_file.exists():
-                print(f"\n[{idx}/{len(locations)}] {location_name}")
-                print(f"  ⚠ Red_Stabilized.tif not found, skipping")
-                self.skipped_files.append(str(red_stabilized_file))
+                plan.append((location_name, red_stabilized_file, None))
                 continue
             
             # Generate output path
-            from folder_utils import get_location_identifier
             location_id = get_location_identifier(
-                loc_info['rep'],
-                loc_info['timepoint'],
-                loc_info['datatype'],
+                loc_info.rep,
+                loc_info.timepoint,
+                loc_info.datatype,
                 location_name
             )
-            output_file = Path(input_mask_folder) / f"{location_id}_Red_Seg.tif"
+            plan.append((location_name, red_stabilized_file,
+                         mask_folder / f"{location_id}_Red_Seg.tif"))
+        
+        # Plan positions whose stack will actually be read (input present, no mask yet)
+        to_read = [pos for pos, (_, _, output_file) in enumerate(plan)
+                   if output_file is not None and not output_file.exists()]
+        
+        # Only pay for loading StarDist when there is something left to segment
+        if to_read and not self.load_model():
+            return {'total': 0, 'success': 0, 'failed': 0, 'skipped': 0}
+        
+        logger.info(f"Processing {len(locations)} locations...")
+        
+        # One reader thread loads the next stack while the current one is segmented
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch') as reader:
+            prefetched = {}
+            
+            def prefetch(read_idx):
+                if read_idx < len(to_read):
+                    pos = to_read[read_idx]
+                    prefetched[pos] = reader.submit(self._read_stack, str(plan[pos][1]))
             
-            print(f"\n[{idx}/{len(locations)}] {location_name}")
-            self.segment_image(str(red_stabilized_file), str(output_file))
+            prefetch(0)
+            next_read = 1
+            
+            for idx, (location_name, red_stabilized_file, output_file) in enumerate(plan, 1):
+                if stop_event is not None and stop_event.is_set():
+                    logger.warning(f"⚠ Segmentation stopped by user after {idx - 1}/{len(locations)} locations")
+                    for future in prefetched.values():
+                        future.cancel()
+                    break
+                
+                logger.info(f"[{idx}/{len(locations)}] {location_name}")
+                if output_file is None:
+                    logger.warning(f"  ⚠ Red_Stabilized.tif not found, skipping")
+                    self.skipped_files.append(str(red_stabilized_file))
+                else:
+                    stack_future = prefetched.pop(idx - 1, None)
+                    if stack_future is not None:
+                        prefetch(next_read)
+                        next_read += 1
+                    self.segment_image(str(red_stabilized_file), str(output_file),
+                                       stack_future=stack_future)
+                
+                if progress_cb is not None:
+                    progress_cb(idx, len(locations))
+        
+        self.wait_for_writes()
         
         # Summary
-        print("\n" + "=" * 80)
-        print("SEGMENTATION COMPLETE")
-        print("=" * 80)
-        print(f"Successfully processed: {self.processed_count}/{len(locations)}")
-        print(f"Skipped (already exist): {len(self.skipped_files)}")
+        logger.info("=" * 80)
+        logger.info("SEGMENTATION COMPLETE")
+        logger.info("=" * 80)
+        logger.info(f"Successfully processed: {self.processed_count}/{len(locations)}")
+        logger.info(f"Skipped (already exist): {len(self.skipped_files)}")
         
         if self.failed_files:
-            print(f"\nFailed files ({len(self.failed_files)}):")
+            logger.warning(f"Failed files ({len(self.failed_files)}):")
             for file, error in self.failed_files:
-                print(f"  - {file}: {error}")
+                logger.warning(f"  - {file}: {error}")
         
         return {
             'total': len(locations),
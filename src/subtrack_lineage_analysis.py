@@ -3,11 +3,11 @@ Subtrack Lineage Analysis Pipeline (v2.0)
 
 This script analyzes TrackMate tracking data to extract subtrack lineages and compute
 motion statistics for each subtrack. It applies quality control filters and uses a
-recursive depth-first search algorithm to build subtrack trees.
+depth-first search algorithm to build subtrack trees.
 
 Key Features:
 - QC filtering by max splits and minimum duration
-- Recursive DFS algorithm with split spot in pre-split subtrack
+- Depth-first search (DFS) with split spot in pre-split subtrack
 - Generates 3 CSV outputs: statistics, edges, and lineage
 - Supports batch processing of multiple locations
 
@@ -18,9 +18,23 @@ Date: 2026-02-11
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, List, Optional
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
+import codecs
+import csv
+import logging
+import os
 import sys
+import threading
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+logger = logging.getLogger(__name__)
 
 # ============================================================================
 # GLOBAL QC PARAMETERS
@@ -28,6 +42,60 @@ import sys
 MAX_SPLITS_ALLOWED = 3
 MIN_TRACK_DURATION_FRAMES = 20
 
+# Column order of the subtrack statistics and lineage tables (rows are stored
+# as tuples in this order)
+STATS_COLUMNS = (
+    'SUBTRACK_ID', 'TRACK_ID', 'SUBTRACK_INDEX', 'START_FRAME', 'END_FRAME',
+    'NUMBER_SPOTS', 'NUMBER_EDGES', 'SUBTRACK_DURATION', 'SUBTRACK_START',
+    'SUBTRACK_STOP', 'SUBTRACK_DISPLACEMENT', 'SUBTRACK_X_LOCATION',
+    'SUBTRACK_Y_LOCATION', 'START_X', 'START_Y', 'END_X', 'END_Y',
+    'SUBTRACK_MEAN_SPEED', 'SUBTRACK_MAX_SPEED', 'SUBTRACK_MIN_SPEED',
+    'SUBTRACK_MEDIAN_SPEED', 'SUBTRACK_STD_SPEED', 'TOTAL_DISTANCE_TRAVELED',
+    'MAX_DISTANCE_TRAVELED', 'CONFINEMENT_RATIO', 'MEAN_STRAIGHT_LINE_SPEED',
+    'LINEARITY_OF_FORWARD_PROGRESSION', 'MEAN_DIRECTIONAL_CHANGE_RATE',
+    'OUTREACH_RATIO', 'TORTUOSITY', 'SUBTRACK_MEAN_QUALITY',
+    'SUBTRACK_MEAN_INTENSITY_CH1',
+)
+# Zero motion statistics (SUBTRACK_MEAN_SPEED through TORTUOSITY) of single-spot subtracks
+EMPTY_MOTION_STATS = (0,) * (STATS_COLUMNS.index('SUBTRACK_MEAN_QUALITY')
+                             - STATS_COLUMNS.index('SUBTRACK_MEAN_SPEED'))
+LINEAGE_COLUMNS = (
+    'SUBTRACK_ID', 'TRACK_ID', 'SUBTRACK_INDEX', 'START_FRAME', 'END_FRAME', 'DURATION',
+    'NUMBER_SPOTS',
+)
+
+# Encodings tried, in order, for TrackMate CSV exports
+CSV_ENCODINGS = ('utf-8', 'latin-1', 'cp1252', 'iso-8859-1')
+
+# Bytes decoded at a time while checking a CSV file's encoding
+ENCODING_CHECK_BLOCK = 1 << 20
+
+# Numeric columns of each TrackMate table; with label/units rows under the header
+# they are parsed as float64 (IDs included, as coercing those rows to NaN did)
+SPOTS_NUMERIC_COLUMNS = ('POSITION_X', 'POSITION_Y', 'POSITION_Z', 'FRAME', 'ID', 'TRACK_ID',
+                         'QUALITY', 'MEAN_INTENSITY_CH1')
+EDGES_NUMERIC_COLUMNS = ('SPOT_SOURCE_ID', 'SPOT_TARGET_ID', 'EDGE_TIME')
+TRACKS_NUMERIC_COLUMNS = ('TRACK_ID', 'NUMBER_SPOTS', 'NUMBER_GAPS', 'NUMBER_SPLITS',
+                          'NUMBER_MERGES', 'TRACK_DURATION', 'TRACK_START', 'TRACK_STOP')
+
+# Most label/units rows TrackMate writes under the column header
+MAX_HEADER_ROWS = 8
+
+# Columns loaded from the spots and tracks tables (edges are written back out
+# with all their columns, so they are read in full); absent ones are skipped
+SPOTS_USECOLS = ('ID', 'TRACK_ID', 'FRAME', 'POSITION_X', 'POSITION_Y',
+                 'QUALITY', 'MEAN_INTENSITY_CH1')
+TRACKS_USECOLS = ('TRACK_ID', 'NUMBER_SPLITS', 'TRACK_DURATION')
+
+# CSV files larger than this (bytes) are parsed in chunks to bound peak memory
+CHUNKED_READ_BYTES = 1 << 30
+
+# Rows parsed per chunk for large CSV files
+READ_CHUNK_ROWS = 1_000_000
+
+# Spot columns pulled into per-track arrays for the subtrack statistics
+TRACK_ARRAY_COLUMNS = ('ID', 'FRAME', 'POSITION_X', 'POSITION_Y', 'QUALITY', 'MEAN_INTENSITY_CH1')
+
 
 # ============================================================================
 # HELPER FUNCTIONS
@@ -42,16 +110,229 @@ def clean_location_name(location_name: str) -> str:
     Returns:
         Cleaned location name (e.g., 'A1_1')
     """
-    if location_name.endswith('_cropped'):
-        return location_name[:-8]  # Remove last 8 characters ('_cropped')
-    return location_name
+    return location_name.removesuffix('_cropped')
+
+
+def _detect_csv_encoding(csv_path: Path) -> str:
+    """
+    Return the first of CSV_ENCODINGS that decodes the whole file.
+    
+    The file is streamed through an incremental decoder, so a wrong guess
+    costs a cheap decode pass instead of a full CSV parse.
+    
+    Raises:
+        ValueError: If no supported encoding decodes the file
+    """
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(csv_path, 'rb') as f:
+                while block := f.read(ENCODING_CHECK_BLOCK):
+                    decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    raise ValueError(f"Could not decode {csv_path.name} with any supported encoding")
+
+
+def _read_numeric_csv(
+    csv_path: Path,
+    numeric_columns: Tuple[str, ...],
+    usecols: Optional[Tuple[str, ...]] = None
+) -> pd.DataFrame:
+    """
+    Read a TrackMate CSV with its numeric columns parsed as numbers.
+    
+    Newer TrackMate versions write label, short label and units rows under
+    the header; they are detected and skipped so the columns can be typed
+    as float64 while parsing. Single-header files keep the types pandas
+    infers (integer IDs stay int64). Non-numeric entries are coerced to
+    NaN after reading. Files larger than
+    CHUNKED_READ_BYTES are parsed READ_CHUNK_ROWS rows at a time.
+    
+    Args:
+        csv_path: Path to the CSV file
+        numeric_columns: Columns to parse as numbers (missing ones are ignored)
+        usecols: Columns to load (missing ones are ignored); None loads all
+    """
+    encoding = _detect_csv_encoding(csv_path)
+    
+    # Count the rows under the header that are not data: some numeric column holds
+    # text (labels, units), or all of them are empty (ID columns have no unit)
+    extra_rows = 0
+    with open(csv_path, newline='', encoding=encoding) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        present = [col for col in numeric_columns if col in header]
+        positions = [header.index(col) for col in present]
+        for row in reader:
+            if not positions or extra_rows >= MAX_HEADER_ROWS:
+                break
+            values = [row[pos] if pos < len(row) else '' for pos in positions]
+            try:
+                for value in values:
+                    if value:
+                        float(value)
+            except ValueError:
+                extra_rows += 1
+                continue
+            if any(values):
+                break
+            extra_rows += 1
+    
+    if usecols is not None:
+        wanted = frozenset(usecols)
+        present = [col for col in present if col in wanted]
+    read_kwargs = {
+        'encoding': encoding,
+        'skiprows': range(1, 1 + extra_rows),
+        'usecols': None if usecols is None else (lambda col: col in wanted),
+    }
+    if os.path.getsize(csv_path) > CHUNKED_READ_BYTES:
+        read_kwargs['chunksize'] = READ_CHUNK_ROWS
+    
+    def read(**kwargs) -> pd.DataFrame:
+        result = pd.read_csv(csv_path, **read_kwargs, **kwargs)
+        if 'chunksize' in read_kwargs:
+            return pd.concat(result, ignore_index=True)
+        return result
+    
+    if not extra_rows:
+        # Single-header export: inferred types, only stray text becomes NaN
+        df = read()
+        for col in present:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        return df
+    
+    try:
+        return read(dtype=dict.fromkeys(present, np.float64))
+    except ValueError:
+        df = read()
+        for col in present:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+        return df
+
+
+def _skipna_mean(values: np.ndarray) -> float:
+    """Mean ignoring NaN, as pandas Series.mean (NaN if no values remain)."""
+    count = np.count_nonzero(~np.isnan(values))
+    return np.nansum(values) / count if count else np.nan
+
+
+def _motion_stats(x: np.ndarray, y: np.ndarray) -> Tuple[float, ...]:
+    """
+    Path and speed measures of a subtrack with at least two spots.
+    
+    Args:
+        x: X positions in frame order
+        y: Y positions in frame order
+    
+    Returns:
+        (total_distance, net_displacement, max_distance, mean_speed, max_speed,
+        min_speed, median_speed, std_speed, mean_angle_change)
+    """
+    # Calculate displacements
+    dx = np.diff(x)
+    dy = np.diff(y)
+    step_distances = np.sqrt(dx**2 + dy**2)
+    
+    # Total distance traveled
+    total_distance = np.sum(step_distances)
+    
+    # Net displacement (start to end)
+    net_displacement = np.sqrt((x[-1] - x[0])**2 + (y[-1] - y[0])**2)
+    
+    # Max distance from origin
+    distances_from_start = np.sqrt((x - x[0])**2 + (y - y[0])**2)
+    max_distance = np.max(distances_from_start)
+    
+    # Speed calculations
+    speeds = step_distances
+    mean_speed = np.mean(speeds)
+    max_speed = np.max(speeds)
+    min_speed = np.min(speeds)
+    median_speed = np.median(speeds)
+    std_speed = np.std(speeds)
+    
+    # Directional change rate
+    if len(dx) > 1:
+        angles = np.arctan2(dy, dx)
+        angle_changes = np.abs(np.diff(angles))
+        angle_changes = np.where(angle_changes > np.pi, 2*np.pi - angle_changes, angle_changes)
+        mean_angle_change = np.mean(angle_changes)
+    else:
+        mean_angle_change = 0
+    
+    return (total_distance, net_displacement, max_distance, mean_speed, max_speed,
+            min_speed, median_speed, std_speed, mean_angle_change)
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _motion_stats_kernel(x, y):
+        """_motion_stats as a single fused loop over the spots."""
+        n_steps = x.shape[0] - 1
+        speeds = np.empty(n_steps)
+        
+        total_distance = 0.0
+        max_speed = -np.inf
+        min_speed = np.inf
+        max_distance = 0.0
+        angle_change_sum = 0.0
+        prev_angle = 0.0
+        for i in range(n_steps):
+            dx = x[i + 1] - x[i]
+            dy = y[i + 1] - y[i]
+            step = np.sqrt(dx * dx + dy * dy)
+            speeds[i] = step
+            total_distance += step
+            max_speed = max(max_speed, step)
+            min_speed = min(min_speed, step)
+            
+            ox = x[i + 1] - x[0]
+            oy = y[i + 1] - y[0]
+            max_distance = max(max_distance, np.sqrt(ox * ox + oy * oy))
+            
+            angle = np.arctan2(dy, dx)
+            if i > 0:
+                change = abs(angle - prev_angle)
+                if change > np.pi:
+                    change = 2 * np.pi - change
+                angle_change_sum += change
+            prev_angle = angle
+        
+        ox = x[n_steps] - x[0]
+        oy = y[n_steps] - y[0]
+        net_displacement = np.sqrt(ox * ox + oy * oy)
+        
+        mean_speed = total_distance / n_steps
+        squared_dev = 0.0
+        for i in range(n_steps):
+            squared_dev += (speeds[i] - mean_speed) ** 2
+        std_speed = np.sqrt(squared_dev / n_steps)
+        
+        speeds.sort()
+        half = n_steps // 2
+        if n_steps % 2:
+            median_speed = speeds[half]
+        else:
+            median_speed = (speeds[half - 1] + speeds[half]) / 2
+        
+        mean_angle_change = angle_change_sum / (n_steps - 1) if n_steps > 1 else 0.0
+        
+        return (total_distance, net_displacement, max_distance, mean_speed, max_speed,
+                min_speed, median_speed, std_speed, mean_angle_change)
+else:
+    _motion_stats_kernel = None
 
 
 class SubtrackAnalyzer:
     """
     Analyzes TrackMate tracking data to generate subtrack lineages.
     
-    This class implements a recursive DFS algorithm to split tracks into subtracks
+    This class implements a DFS algorithm to split tracks into subtracks
     based on division events, compute motion statistics for each subtrack, and
     maintain parent-child relationships.
     """
@@ -75,7 +356,7 @@ class SubtrackAnalyzer:
         self.filtered_tracks = None
         
         self.subtrack_stats = []
-        self.subtrack_edges = []
+        self._edge_assignments = []  # (edges_df row positions, subtrack ID) per subtrack
         self.subtrack_lineage = []
         self.subtrack_counter = 0
         self.track_subtrack_counters = {}  # Track subtrack index per original track
@@ -93,7 +374,7 @@ class SubtrackAnalyzer:
             if not csv_files:
                 csv_files = list(self.tracking_result_folder.glob("*-spots.csv"))
             if not csv_files:
-                print(f"  ✗ No spots CSV file found in {self.tracking_result_folder}")
+                logger.error(f"  ✗ No spots CSV file found in {self.tracking_result_folder}")
                 return False
             
             # Determine base name based on which pattern was found
@@ -107,45 +388,19 @@ class SubtrackAnalyzer:
             edges_file = self.tracking_result_folder / f"{base_name}-edges.csv"
             tracks_file = self.tracking_result_folder / f"{base_name}-tracks.csv"
             
-            # Try different encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            for encoding in encodings:
-                try:
-                    self.spots_df = pd.read_csv(spots_file, encoding=encoding)
-                    self.edges_df = pd.read_csv(edges_file, encoding=encoding)
-                    self.tracks_df = pd.read_csv(tracks_file, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Could not decode CSV files with any supported encoding")
-            
-            # Ensure numeric columns are the correct type
-            numeric_cols_spots = ['POSITION_X', 'POSITION_Y', 'POSITION_Z', 'FRAME', 'ID', 'TRACK_ID', 
-                                  'QUALITY', 'MEAN_INTENSITY_CH1']
-            for col in numeric_cols_spots:
-                if col in self.spots_df.columns:
-                    self.spots_df[col] = pd.to_numeric(self.spots_df[col], errors='coerce')
-            
-            numeric_cols_edges = ['SPOT_SOURCE_ID', 'SPOT_TARGET_ID', 'EDGE_TIME']
-            for col in numeric_cols_edges:
-                if col in self.edges_df.columns:
-                    self.edges_df[col] = pd.to_numeric(self.edges_df[col], errors='coerce')
-            
-            numeric_cols_tracks = ['TRACK_ID', 'NUMBER_SPOTS', 'NUMBER_GAPS', 'NUMBER_SPLITS', 
-                                   'NUMBER_MERGES', 'TRACK_DURATION', 'TRACK_START', 'TRACK_STOP']
-            for col in numeric_cols_tracks:
-                if col in self.tracks_df.columns:
-                    self.tracks_df[col] = pd.to_numeric(self.tracks_df[col], errors='coerce')
+            # Parse each file once, numeric columns typed while parsing
+            self.spots_df = _read_numeric_csv(spots_file, SPOTS_NUMERIC_COLUMNS, SPOTS_USECOLS)
+            self.edges_df = _read_numeric_csv(edges_file, EDGES_NUMERIC_COLUMNS)
+            self.tracks_df = _read_numeric_csv(tracks_file, TRACKS_NUMERIC_COLUMNS, TRACKS_USECOLS)
             
-            print(f"  ✓ Loaded {len(self.tracks_df)} tracks")
-            print(f"  ✓ Loaded {len(self.spots_df)} spots")
-            print(f"  ✓ Loaded {len(self.edges_df)} edges")
+            logger.info(f"  ✓ Loaded {len(self.tracks_df)} tracks")
+            logger.info(f"  ✓ Loaded {len(self.spots_df)} spots")
+            logger.info(f"  ✓ Loaded {len(self.edges_df)} edges")
             
             return True
             
         except Exception as e:
-            print(f"  ✗ Error loading data: {e}")
+            logger.error(f"  ✗ Error loading data: {e}")
             return False
     
     def apply_qc_filter(self):
@@ -156,160 +411,231 @@ class SubtrackAnalyzer:
         1. Remove tracks with > max_splits splits
         2. Remove tracks with < min_duration frames
         """
-        print(f"\nApplying QC filters:")
-        print(f"  - Max splits: {self.max_splits}")
-        print(f"  - Min duration: {self.min_duration} frames")
+        logger.info(f"Applying QC filters:")
+        logger.info(f"  - Max splits: {self.max_splits}")
+        logger.info(f"  - Min duration: {self.min_duration} frames")
         
-        original_count = len(self.tracks_df)
-        
-        # Ensure numeric columns are the correct type
-        self.tracks_df['NUMBER_SPLITS'] = pd.to_numeric(self.tracks_df['NUMBER_SPLITS'], errors='coerce')
-        self.tracks_df['TRACK_DURATION'] = pd.to_numeric(self.tracks_df['TRACK_DURATION'], errors='coerce')
+        # Both predicates on the raw columns (load_data parsed them as float64),
+        # then a single selection
+        splits_ok = self.tracks_df['NUMBER_SPLITS'].to_numpy() <= self.max_splits
+        duration_ok = self.tracks_df['TRACK_DURATION'].to_numpy() >= self.min_duration
         
         # Filter by splits
-        tracks_by_splits = self.tracks_df[self.tracks_df['NUMBER_SPLITS'] <= self.max_splits]
-        removed_splits = original_count - len(tracks_by_splits)
+        removed_splits = int(np.count_nonzero(~splits_ok))
         if removed_splits > 0:
-            print(f"  ✗ Removed {removed_splits} tracks (splits > {self.max_splits})")
+            logger.info(f"  ✗ Removed {removed_splits} tracks (splits > {self.max_splits})")
         
         # Filter by duration
-        self.filtered_tracks = tracks_by_splits[
-            tracks_by_splits['TRACK_DURATION'] >= self.min_duration
-        ]
-        removed_duration = len(tracks_by_splits) - len(self.filtered_tracks)
+        removed_duration = int(np.count_nonzero(splits_ok & ~duration_ok))
         if removed_duration > 0:
-            print(f"  ✗ Removed {removed_duration} tracks (duration < {self.min_duration})")
+            logger.info(f"  ✗ Removed {removed_duration} tracks (duration < {self.min_duration})")
+        
+        self.filtered_tracks = self.tracks_df.loc[splits_ok & duration_ok]
         
-        print(f"  ✓ Retained {len(self.filtered_tracks)} tracks for analysis")
+        logger.info(f"  ✓ Retained {len(self.filtered_tracks)} tracks for analysis")
     
     def build_subtrack_tree(self):
         """
-        Build subtrack lineages using recursive depth-first search.
+        Build subtrack lineages using depth-first search.
         
         Algorithm:
         - For each filtered track, find the root spot
-        - Recursively traverse the lineage tree
+        - Traverse the lineage tree depth-first
         - Split spots are included in the pre-split subtrack
         - Each branch after a split becomes a new subtrack
         """
-        print(f"\nBuilding subtrack lineages...")
+        logger.info(f"Building subtrack lineages...")
         
-        for _, track in self.filtered_tracks.iterrows():
-            track_id = track['TRACK_ID']
-            
+        # Split spots and edges by track once instead of scanning both tables per track
+        spots_by_track = dict(tuple(self.spots_df.groupby('TRACK_ID', sort=False)))
+        
+        # An edge belongs to the track of its source spot (or of its target, if the
+        # source is not a tracked spot)
+        spot_track = pd.Series(self.spots_df['TRACK_ID'].to_numpy(), index=self.spots_df['ID'].to_numpy())
+        spot_track = spot_track[~spot_track.index.duplicated()]
+        edge_track = self.edges_df['SPOT_SOURCE_ID'].map(spot_track).fillna(
+            self.edges_df['SPOT_TARGET_ID'].map(spot_track)
+        )
+        edge_rows_by_track = self.edges_df.groupby(edge_track, sort=False).indices
+        no_edge_rows = np.empty(0, dtype=np.intp)
+        edge_sources = self.edges_df['SPOT_SOURCE_ID'].to_numpy()
+        edge_targets = self.edges_df['SPOT_TARGET_ID'].to_numpy()
+        
+        for track_id in self.filtered_tracks['TRACK_ID'].to_numpy():
             # Initialize subtrack counter for this track
             self.track_subtrack_counters[track_id] = 0
             
             # Get all spots in this track
-            track_spots = self.spots_df[self.spots_df['TRACK_ID'] == track_id].copy()
-            track_edges = self.edges_df[
-                self.edges_df['SPOT_SOURCE_ID'].isin(track_spots['ID']) |
-                self.edges_df['SPOT_TARGET_ID'].isin(track_spots['ID'])
-            ].copy()
+            track_spots = spots_by_track.get(track_id)
+            if track_spots is None:
+                continue
+            # Edge rows of this track (positions in edges_df)
+            edge_rows = edge_rows_by_track.get(track_id, no_edge_rows)
             
-            # Find root spot (no incoming edge)
-            root_candidates = track_spots[
-                ~track_spots['ID'].isin(track_edges['SPOT_TARGET_ID'])
-            ]
+            # Spot columns as arrays in frame order, and each spot's row in them
+            order = np.argsort(track_spots['FRAME'].to_numpy(), kind='stable')
+            track_arrays = {
+                col: track_spots[col].to_numpy()[order]
+                for col in TRACK_ARRAY_COLUMNS if col in track_spots.columns
+            }
+            id_to_row = {spot_id: row for row, spot_id in enumerate(track_arrays['ID'])}
             
-            if len(root_candidates) == 0:
-                continue
+            # Outgoing targets of each spot, and the edge rows linking each
+            # (source, target) pair, in edge table order
+            children = defaultdict(list)
+            pair_rows = defaultdict(list)
+            for row, source_id, target_id in zip(edge_rows, edge_sources[edge_rows],
+                                                 edge_targets[edge_rows]):
+                children[source_id].append(target_id)
+                pair_rows[(source_id, target_id)].append(row)
             
-            root_spot_id = root_candidates.iloc[0]['ID']
+            # Find root spot (first spot with no incoming edge)
+            targets = set(edge_targets[edge_rows])
+            root_spot_id = next(
+                (spot_id for spot_id in track_spots['ID'].to_numpy() if spot_id not in targets),
+                None
+            )
             
-            # Start recursive DFS
+            if root_spot_id is None:
+                continue
+            
+            # Walk the lineage tree from the root
             self._dfs_build_subtrack(
-                current_spot_id=root_spot_id,
+                root_spot_id=root_spot_id,
                 track_id=track_id,
-                track_spots=track_spots,
-                track_edges=track_edges,
-                parent_subtrack_id=None,
-                generation=0
+                track_arrays=track_arrays,
+                id_to_row=id_to_row,
+                children=children,
+                pair_rows=pair_rows
             )
         
-        print(f"  ✓ Generated {self.subtrack_counter} subtracks from {len(self.filtered_tracks)} tracks")
+        logger.info(f"  ✓ Generated {self.subtrack_counter} subtracks from {len(self.filtered_tracks)} tracks")
     
     def _dfs_build_subtrack(
         self,
-        current_spot_id: int,
+        root_spot_id: float,
         track_id: int,
-        track_spots: pd.DataFrame,
-        track_edges: pd.DataFrame,
-        parent_subtrack_id: Optional[int],
-        generation: int
+        track_arrays: Dict[str, np.ndarray],
+        id_to_row: Dict[float, int],
+        children: Dict[float, List[float]],
+        pair_rows: Dict[Tuple[float, float], List[int]]
     ):
         """
-        Recursive DFS to build subtracks.
+        Depth-first walk of one track's lineage tree, building its subtracks.
+        
+        Uses an explicit stack rather than recursion, so deep lineages cannot hit
+        the recursion limit. Subtracks are numbered as they are entered and
+        recorded after all of their daughters, in the same order as a recursive
+        walk.
         
         Args:
-            current_spot_id: Starting spot for this subtrack
+            root_spot_id: First spot of the track
             track_id: Original track ID
-            track_spots: All spots in the track
-            track_edges: All edges in the track
-            parent_subtrack_id: Parent subtrack ID (None for root)
-            generation: Generation number (0 for root)
+            track_arrays: Spot columns of the track, in frame order
+            id_to_row: Row of each spot ID within track_arrays
+            children: Target spot IDs of each spot's outgoing edges
+            pair_rows: edges_df rows of the edges linking each (source, target) pair
         """
-        # Assign new subtrack ID and index
-        self.track_subtrack_counters[track_id] += 1
-        subtrack_index = self.track_subtrack_counters[track_id]
-        subtrack_id = f"Track_{track_id}_Sub_{subtrack_index}"
-        self.subtrack_counter += 1
-        
-        # Collect spots for this subtrack
-        subtrack_spot_ids = []
-        current_id = current_spot_id
-        
-        while current_id is not None:
-            subtrack_spot_ids.append(current_id)
+        # Spot IDs already placed in a subtrack of this track
+        visited = set()
+        
+        # ('walk', start spot, parent subtrack ID, generation) for a subtrack still
+        # to walk, ('record', subtrack ID, index, spot IDs, parent, generation) for
+        # one whose daughters are all done
+        stack = [('walk', root_spot_id, None, 0)]
+        
+        while stack:
+            entry = stack.pop()
+            if entry[0] == 'record':
+                self._record_subtrack(*entry[1:], track_id=track_id, track_arrays=track_arrays,
+                                      id_to_row=id_to_row, children=children,
+                                      pair_rows=pair_rows)
+                continue
+            _, current_spot_id, parent_subtrack_id, generation = entry
             
-            # Find outgoing edges from current spot
-            outgoing_edges = track_edges[track_edges['SPOT_SOURCE_ID'] == current_id]
+            # A merge can lead back into spots that are already assigned
+            if current_spot_id in visited:
+                continue
             
-            if len(outgoing_edges) == 0:
-                # Terminal spot - end of subtrack
-                break
-            elif len(outgoing_edges) == 1:
-                # No split - continue to next spot
-                current_id = outgoing_edges.iloc[0]['SPOT_TARGET_ID']
-            else:
-                # Split detected - include split spot in this subtrack, then branch
-                # Process each daughter branch as new subtrack
-                for _, edge in outgoing_edges.iterrows():
-                    daughter_spot_id = edge['SPOT_TARGET_ID']
-                    self._dfs_build_subtrack(
-                        current_spot_id=daughter_spot_id,
-                        track_id=track_id,
-                        track_spots=track_spots,
-                        track_edges=track_edges,
-                        parent_subtrack_id=subtrack_id,
-                        generation=generation + 1
-                    )
-                break
-        
+            # Assign new subtrack ID and index
+            self.track_subtrack_counters[track_id] += 1
+            subtrack_index = self.track_subtrack_counters[track_id]
+            subtrack_id = f"Track_{track_id}_Sub_{subtrack_index}"
+            self.subtrack_counter += 1
+            
+            # Collect spots for this subtrack
+            subtrack_spot_ids = []
+            current_id = current_spot_id
+            daughters = ()
+            
+            while current_id is not None:
+                if current_id in visited:
+                    # Rejoined an already walked branch (merge) - end of subtrack
+                    break
+                visited.add(current_id)
+                subtrack_spot_ids.append(current_id)
+                
+                # Find outgoing edges from current spot
+                targets = children.get(current_id, ())
+                
+                if len(targets) == 0:
+                    # Terminal spot - end of subtrack
+                    break
+                elif len(targets) == 1:
+                    # No split - continue to next spot
+                    current_id = targets[0]
+                else:
+                    # Split detected - include split spot in this subtrack, then branch
+                    daughters = targets
+                    break
+            
+            # Record this subtrack once every daughter branch (a new subtrack each)
+            # has been walked; daughters are pushed last-first so they pop in order
+            stack.append(('record', subtrack_id, subtrack_index, subtrack_spot_ids,
+                          parent_subtrack_id, generation))
+            for daughter_spot_id in reversed(daughters):
+                stack.append(('walk', daughter_spot_id, subtrack_id, generation + 1))
+    
+    def _record_subtrack(
+        self,
+        subtrack_id: str,
+        subtrack_index: int,
+        subtrack_spot_ids: List[float],
+        parent_subtrack_id: Optional[str],
+        generation: int,
+        track_id: int,
+        track_arrays: Dict[str, np.ndarray],
+        id_to_row: Dict[float, int],
+        children: Dict[float, List[float]],
+        pair_rows: Dict[Tuple[float, float], List[int]]
+    ):
+        """Store the lineage row, statistics and edges of one finished subtrack."""
         # Get frame statistics first
-        subtrack_spots = track_spots[track_spots['ID'].isin(subtrack_spot_ids)].sort_values('FRAME')
-        start_frame = int(subtrack_spots['FRAME'].min())
-        end_frame = int(subtrack_spots['FRAME'].max())
+        rows = self._subtrack_rows(id_to_row, subtrack_spot_ids)
+        start_frame = int(track_arrays['FRAME'][rows[0]])
+        end_frame = int(track_arrays['FRAME'][rows[-1]])
         duration = end_frame - start_frame
         
         # Store subtrack lineage info
-        self.subtrack_lineage.append({
-            'SUBTRACK_ID': subtrack_id,
-            'TRACK_ID': track_id,
-            'SUBTRACK_INDEX': subtrack_index,
-            'START_FRAME': start_frame,
-            'END_FRAME': end_frame,
-            'DURATION': duration,
-            'NUMBER_SPOTS': len(subtrack_spot_ids)
-        })
+        self.subtrack_lineage.append((
+            subtrack_id,
+            track_id,
+            subtrack_index,
+            start_frame,
+            end_frame,
+            duration,
+            len(subtrack_spot_ids)
+        ))
         
         # Compute statistics for this subtrack
         self._compute_subtrack_statistics(
             subtrack_id=subtrack_id,
             subtrack_index=subtrack_index,
-            subtrack_spot_ids=subtrack_spot_ids,
+            rows=rows,
+            start_frame=start_frame,
+            end_frame=end_frame,
             track_id=track_id,
-            track_spots=track_spots,
+            track_arrays=track_arrays,
             parent_subtrack_id=parent_subtrack_id,
             generation=generation
         )
@@ -318,98 +644,68 @@ class SubtrackAnalyzer:
         self._assign_edges_to_subtrack(
             subtrack_id=subtrack_id,
             subtrack_spot_ids=subtrack_spot_ids,
-            track_edges=track_edges
+            children=children,
+            pair_rows=pair_rows
         )
     
     def _compute_subtrack_statistics(
         self,
         subtrack_id: str,
         subtrack_index: int,
-        subtrack_spot_ids: List[int],
+        rows: np.ndarray,
+        start_frame: int,
+        end_frame: int,
         track_id: int,
-        track_spots: pd.DataFrame,
+        track_arrays: Dict[str, np.ndarray],
         parent_subtrack_id: Optional[str],
         generation: int
     ):
-        """Compute motion statistics for a subtrack."""
-        # Get spots for this subtrack
-        spots = track_spots[track_spots['ID'].isin(subtrack_spot_ids)].sort_values('FRAME')
+        """
+        Compute motion statistics for a subtrack.
+        
+        Args:
+            subtrack_id: Subtrack ID (e.g., 'Track_3_Sub_2')
+            subtrack_index: Subtrack index within its track
+            rows: Rows of the subtrack's spots in track_arrays, in frame order
+            start_frame: First frame of the subtrack
+            end_frame: Last frame of the subtrack
+            track_id: Original track ID
+            track_arrays: Spot columns of the track, in frame order
+            parent_subtrack_id: Parent subtrack ID (None for root)
+            generation: Generation number (0 for root)
+        """
+        n_spots = len(rows)
         
         # Calculate mean quality and intensity
-        mean_quality = spots['QUALITY'].mean() if 'QUALITY' in spots.columns else 0
-        mean_intensity = spots['MEAN_INTENSITY_CH1'].mean() if 'MEAN_INTENSITY_CH1' in spots.columns else 0
+        mean_quality = _skipna_mean(track_arrays['QUALITY'][rows]) if 'QUALITY' in track_arrays else 0
+        mean_intensity = (_skipna_mean(track_arrays['MEAN_INTENSITY_CH1'][rows])
+                          if 'MEAN_INTENSITY_CH1' in track_arrays else 0)
         
         # Calculate number of edges (n_spots - 1)
-        number_edges = len(spots) - 1 if len(spots) > 1 else 0
-        
-        if len(spots) < 2:
-            # Need at least 2 spots for statistics
-            self.subtrack_stats.append({
-                'SUBTRACK_ID': subtrack_id,
-                'TRACK_ID': track_id,
-                'SUBTRACK_INDEX': subtrack_index,
-                'START_FRAME': int(spots['FRAME'].min()) if len(spots) > 0 else 0,
-                'END_FRAME': int(spots['FRAME'].max()) if len(spots) > 0 else 0,
-                'NUMBER_SPOTS': len(spots),
-                'NUMBER_EDGES': number_edges,
-                'SUBTRACK_DURATION': 0,
-                'SUBTRACK_START': int(spots['FRAME'].min()) if len(spots) > 0 else 0,
-                'SUBTRACK_STOP': int(spots['FRAME'].max()) if len(spots) > 0 else 0,
-                'SUBTRACK_DISPLACEMENT': 0,
-                'SUBTRACK_X_LOCATION': spots['POSITION_X'].mean() if len(spots) > 0 else 0,
-                'SUBTRACK_Y_LOCATION': spots['POSITION_Y'].mean() if len(spots) > 0 else 0,
-                'START_X': spots.iloc[0]['POSITION_X'] if len(spots) > 0 else 0,
-                'START_Y': spots.iloc[0]['POSITION_Y'] if len(spots) > 0 else 0,
-                'END_X': spots.iloc[-1]['POSITION_X'] if len(spots) > 0 else 0,
-                'END_Y': spots.iloc[-1]['POSITION_Y'] if len(spots) > 0 else 0,
-                'SUBTRACK_MEAN_SPEED': 0,
-                'SUBTRACK_MAX_SPEED': 0,
-                'SUBTRACK_MIN_SPEED': 0,
-                'SUBTRACK_MEDIAN_SPEED': 0,
-                'SUBTRACK_STD_SPEED': 0,
-                'TOTAL_DISTANCE_TRAVELED': 0,
-                'MAX_DISTANCE_TRAVELED': 0,
-                'CONFINEMENT_RATIO': 0,
-                'MEAN_STRAIGHT_LINE_SPEED': 0,
-                'LINEARITY_OF_FORWARD_PROGRESSION': 0,
-                'MEAN_DIRECTIONAL_CHANGE_RATE': 0,
-                'OUTREACH_RATIO': 0,
-                'TORTUOSITY': 0,
-                'SUBTRACK_MEAN_QUALITY': mean_quality,
-                'SUBTRACK_MEAN_INTENSITY_CH1': mean_intensity
-            })
-            return
-        
-        # Basic measurements
-        n_spots = len(spots)
-        duration = spots['FRAME'].max() - spots['FRAME'].min()
+        number_edges = n_spots - 1 if n_spots > 1 else 0
         
-        # Position arrays
-        x = spots['POSITION_X'].values
-        y = spots['POSITION_Y'].values
-        
-        # Calculate displacements
-        dx = np.diff(x)
-        dy = np.diff(y)
-        step_distances = np.sqrt(dx**2 + dy**2)
-        
-        # Total distance traveled
-        total_distance = np.sum(step_distances)
+        if n_spots < 2:
+            # Need at least 2 spots for statistics; single spots get zero motion
+            x0 = track_arrays['POSITION_X'][rows[0]]
+            y0 = track_arrays['POSITION_Y'][rows[0]]
+            self.subtrack_stats.append((
+                subtrack_id, track_id, subtrack_index, start_frame, end_frame,
+                n_spots, number_edges, 0, start_frame, end_frame, 0,
+                x0, y0, x0, y0, x0, y0,
+            ) + EMPTY_MOTION_STATS + (mean_quality, mean_intensity))
+            return
         
-        # Net displacement (start to end)
-        net_displacement = np.sqrt((x[-1] - x[0])**2 + (y[-1] - y[0])**2)
+        # Spot positions for this subtrack, in frame order
+        x = track_arrays['POSITION_X'][rows]
+        y = track_arrays['POSITION_Y'][rows]
         
-        # Max distance from origin
-        distances_from_start = np.sqrt((x - x[0])**2 + (y - y[0])**2)
-        max_distance = np.max(distances_from_start)
+        # Basic measurements
+        duration = end_frame - start_frame
         
-        # Speed calculations
-        speeds = step_distances
-        mean_speed = np.mean(speeds) if len(speeds) > 0 else 0
-        max_speed = np.max(speeds) if len(speeds) > 0 else 0
-        min_speed = np.min(speeds) if len(speeds) > 0 else 0
-        median_speed = np.median(speeds) if len(speeds) > 0 else 0
-        std_speed = np.std(speeds) if len(speeds) > 0 else 0
+        # Path and speed measures (fused Numba loop when available)
+        motion_stats = _motion_stats_kernel if _motion_stats_kernel is not None else _motion_stats
+        (total_distance, net_displacement, max_distance, mean_speed, max_speed,
+         min_speed, median_speed, std_speed, mean_angle_change) = motion_stats(x, y)
         
         # Straight line speed (net displacement / duration)
         mean_straight_line_speed = net_displacement / duration if duration > 0 else 0
@@ -427,118 +723,125 @@ class SubtrackAnalyzer:
         tortuosity = total_distance / net_displacement if net_displacement > 0 else 0
         
         # Directional change rate
-        if len(dx) > 1:
-            angles = np.arctan2(dy, dx)
-            angle_changes = np.abs(np.diff(angles))
-            angle_changes = np.where(angle_changes > np.pi, 2*np.pi - angle_changes, angle_changes)
-            mean_angle_change = np.mean(angle_changes)
-            directional_change_rate = mean_angle_change
-        else:
-            mean_angle_change = 0
-            directional_change_rate = 0
-        
-        # Calculate mean quality and intensity
-        mean_quality = spots['QUALITY'].mean() if 'QUALITY' in spots.columns else 0
-        mean_intensity = spots['MEAN_INTENSITY_CH1'].mean() if 'MEAN_INTENSITY_CH1' in spots.columns else 0
-        
-        # Calculate number of edges
-        number_edges = len(spots) - 1
+        directional_change_rate = mean_angle_change
         
         # Store statistics with corrected column names
-        self.subtrack_stats.append({
-            'SUBTRACK_ID': subtrack_id,
-            'TRACK_ID': track_id,
-            'SUBTRACK_INDEX': subtrack_index,
-            'START_FRAME': int(spots['FRAME'].min()),
-            'END_FRAME': int(spots['FRAME'].max()),
-            'NUMBER_SPOTS': n_spots,
-            'NUMBER_EDGES': number_edges,
-            'SUBTRACK_DURATION': int(duration),
-            'SUBTRACK_START': int(spots['FRAME'].min()),
-            'SUBTRACK_STOP': int(spots['FRAME'].max()),
-            'SUBTRACK_DISPLACEMENT': net_displacement,
-            'SUBTRACK_X_LOCATION': np.mean(x),
-            'SUBTRACK_Y_LOCATION': np.mean(y),
-            'START_X': x[0],
-            'START_Y': y[0],
-            'END_X': x[-1],
-            'END_Y': y[-1],
-            'SUBTRACK_MEAN_SPEED': mean_speed,
-            'SUBTRACK_MAX_SPEED': max_speed,
-            'SUBTRACK_MIN_SPEED': min_speed,
-            'SUBTRACK_MEDIAN_SPEED': median_speed,
-            'SUBTRACK_STD_SPEED': std_speed,
-            'TOTAL_DISTANCE_TRAVELED': total_distance,
-            'MAX_DISTANCE_TRAVELED': max_distance,
-            'CONFINEMENT_RATIO': confinement_ratio,
-            'MEAN_STRAIGHT_LINE_SPEED': mean_straight_line_speed,
-            'LINEARITY_OF_FORWARD_PROGRESSION': linearity_forward,
-            'MEAN_DIRECTIONAL_CHANGE_RATE': directional_change_rate,
-            'OUTREACH_RATIO': outreach_ratio,
-            'TORTUOSITY': tortuosity,
-            'SUBTRACK_MEAN_QUALITY': mean_quality,
-            'SUBTRACK_MEAN_INTENSITY_CH1': mean_intensity
-        })
+        self.subtrack_stats.append((
+            subtrack_id,
+            track_id,
+            subtrack_index,
+            start_frame,
+            end_frame,
+            n_spots,
+            number_edges,
+            duration,
+            start_frame,
+            end_frame,
+            net_displacement,
+            np.mean(x),
+            np.mean(y),
+            x[0],
+            y[0],
+            x[-1],
+            y[-1],
+            mean_speed,
+            max_speed,
+            min_speed,
+            median_speed,
+            std_speed,
+            total_distance,
+            max_distance,
+            confinement_ratio,
+            mean_straight_line_speed,
+            linearity_forward,
+            directional_change_rate,
+            outreach_ratio,
+            tortuosity,
+            mean_quality,
+            mean_intensity
+        ))
+    
+    @staticmethod
+    def _subtrack_rows(id_to_row: Dict[float, int], subtrack_spot_ids: List[float]) -> np.ndarray:
+        """Rows of the track arrays for the given spot IDs, in frame order."""
+        rows = np.array([id_to_row[spot_id] for spot_id in subtrack_spot_ids if spot_id in id_to_row],
+                        dtype=np.intp)
+        rows.sort()
+        return rows
     
     def _assign_edges_to_subtrack(
         self,
         subtrack_id: str,
-        subtrack_spot_ids: List[int],
-        track_edges: pd.DataFrame
+        subtrack_spot_ids: List[float],
+        children: Dict[float, List[float]],
+        pair_rows: Dict[Tuple[float, float], List[int]]
     ):
-        """Assign edges to a subtrack."""
-        subtrack_edge_mask = (
-            track_edges['SPOT_SOURCE_ID'].isin(subtrack_spot_ids) &
-            track_edges['SPOT_TARGET_ID'].isin(subtrack_spot_ids)
-        )
-        
-        edges_in_subtrack = track_edges[subtrack_edge_mask].copy()
-        edges_in_subtrack['SUBTRACK_ID'] = subtrack_id
+        """Record which of the track's edges belong to a subtrack."""
+        # Edges with both ends in the subtrack: along its chain these are each
+        # spot's single outgoing edge, so only the subtrack's own spots are visited
+        spot_ids = frozenset(subtrack_spot_ids)
+        rows = [
+            row
+            for source_id in subtrack_spot_ids
+            for target_id in dict.fromkeys(children.get(source_id, ()))
+            if target_id in spot_ids
+            for row in pair_rows[(source_id, target_id)]
+        ]
+        rows.sort()
         
-        self.subtrack_edges.append(edges_in_subtrack)
+        self._edge_assignments.append((np.array(rows, dtype=np.intp), subtrack_id))
     
     def generate_subtrack_edges(self):
         """Consolidate all subtrack edges into a single DataFrame."""
-        print(f"\nGenerating subtrack-grouped edges...")
+        logger.info(f"Generating subtrack-grouped edges...")
         
-        if self.subtrack_edges:
-            self.subtrack_edges_df = pd.concat(self.subtrack_edges, ignore_index=True)
-            print(f"  ✓ Assigned {len(self.subtrack_edges_df)} edges to subtracks")
+        if self._edge_assignments:
+            # Slice edges_df once and label the rows, instead of a copy per subtrack
+            row_arrays, subtrack_ids = zip(*self._edge_assignments)
+            all_rows = np.concatenate(row_arrays)
+            all_ids = np.repeat(np.array(subtrack_ids, dtype=object),
+                                [len(rows) for rows in row_arrays])
+            self.subtrack_edges_df = (
+                self.edges_df.iloc[all_rows]
+                .assign(SUBTRACK_ID=all_ids)
+                .reset_index(drop=True)
+            )
+            logger.info(f"  ✓ Assigned {len(self.subtrack_edges_df)} edges to subtracks")
         else:
             self.subtrack_edges_df = pd.DataFrame()
-            print(f"  ✗ No edges to assign")
+            logger.warning(f"  ⚠ No edges to assign")
     
     def save_results(self, output_folder: Path, base_name: str):
         """Save analysis results to CSV files."""
         output_folder.mkdir(parents=True, exist_ok=True)
         
-        print(f"\nSaving results to {output_folder}...")
+        logger.info(f"Saving results to {output_folder}...")
         
         # Save subtrack statistics
-        stats_df = pd.DataFrame(self.subtrack_stats)
+        stats_df = pd.DataFrame.from_records(self.subtrack_stats, columns=STATS_COLUMNS)
         stats_file = output_folder / f"{base_name}-subtrack_statistics.csv"
         stats_df.to_csv(stats_file, index=False)
-        print(f"  ✓ {stats_file.name} ({len(stats_df)} subtracks)")
+        logger.info(f"  ✓ {stats_file.name} ({len(stats_df)} subtracks)")
         
         # Save subtrack edges
         edges_file = output_folder / f"{base_name}-subtrack_edges.csv"
         self.subtrack_edges_df.to_csv(edges_file, index=False)
-        print(f"  ✓ {edges_file.name} ({len(self.subtrack_edges_df)} edges)")
+        logger.info(f"  ✓ {edges_file.name} ({len(self.subtrack_edges_df)} edges)")
         
         # Save subtrack lineage
-        lineage_df = pd.DataFrame(self.subtrack_lineage)
+        lineage_df = pd.DataFrame.from_records(self.subtrack_lineage, columns=LINEAGE_COLUMNS)
         lineage_file = output_folder / f"{base_name}-subtrack_lineage.csv"
         lineage_df.to_csv(lineage_file, index=False)
-        print(f"  ✓ {lineage_file.name} ({len(lineage_df)} lineage records)")
+        logger.info(f"  ✓ {lineage_file.name} ({len(lineage_df)} lineage records)")
     
     def run(self):
         """Execute the complete analysis pipeline."""
-        print("=" * 80)
-        print("SUBTRACK LINEAGE ANALYSIS PIPELINE")
-        print("=" * 80)
+        logger.info("=" * 80)
+        logger.info("SUBTRACK LINEAGE ANALYSIS PIPELINE")
+        logger.info("=" * 80)
         
         # Load data
-        print("Loading TrackMate data files...")
+        logger.info("Loading TrackMate data files...")
         if not self.load_data():
             return False
         
@@ -546,7 +849,7 @@ class SubtrackAnalyzer:
         self.apply_qc_filter()
         
         if len(self.filtered_tracks) == 0:
-            print("\n✗ No tracks remaining after QC filtering!")
+            logger.error("✗ No tracks remaining after QC filtering!")
             return False
         
         # Build subtrack tree
@@ -568,9 +871,9 @@ class SubtrackAnalyzer:
         output_folder = self.tracking_result_folder / "secondary_analysis"
         self.save_results(output_folder, base_name)
         
-        print("\n" + "=" * 80)
-        print("ANALYSIS COMPLETE!")
-        print("=" * 80)
+        logger.info("=" * 80)
+        logger.info("ANALYSIS COMPLETE!")
+        logger.info("=" * 80)
         
         return True
 
@@ -578,15 +881,24 @@ class SubtrackAnalyzer:
 def batch_analyze_all_locations(
     parent_folder: Path,
     max_splits: int = None,
-    min_duration: int = None
+    min_duration: int = None,
+    max_workers: Optional[int] = None,
+    stop_event: Optional[threading.Event] = None
 ) -> Dict[str, bool]:
     """
     Batch process all locations under a parent folder.
     
+    Locations are independent, so they are analyzed in parallel worker
+    processes. Each worker's log records are collected and re-logged here
+    once its location finishes, keeping the log grouped per location.
+    
     Args:
         parent_folder: Parent folder to search for locations
         max_splits: Maximum allowed splits per track
         min_duration: Minimum track duration in frames
+        max_workers: Number of worker processes (default: CPU count).
+            Use 1 to analyze locations sequentially in this process.
+        stop_event: Optional event; once set, locations not yet started are skipped
     
     Returns:
         Dictionary mapping location names to success status
@@ -594,69 +906,162 @@ def batch_analyze_all_locations(
     parent_path = Path(parent_folder)
     
     # Find all 'Tracking Result' folders
-    print("Searching for Tracking Result folders...")
+    logger.info("Searching for Tracking Result folders...")
     tracking_result_folders = []
     
     for item in parent_path.rglob('*'):
         if item.is_dir() and item.name == 'Tracking Result':
             tracking_result_folders.append(item)
     
-    print(f"Found {len(tracking_result_folders)} locations to process\n")
+    logger.info(f"Found {len(tracking_result_folders)} locations to process\n")
     
     if len(tracking_result_folders) == 0:
-        print("No 'Tracking Result' folders found!")
+        logger.info("No 'Tracking Result' folders found!")
         return {}
     
     # Process each location
     results = {}
     successful = 0
     failed = 0
+    total = len(tracking_result_folders)
     
-    for idx, tracking_result_folder in enumerate(tracking_result_folders, 1):
-        location_name = clean_location_name(tracking_result_folder.parent.name)  # Remove '_cropped' suffix if present
-        
-        print(f"[{idx}/{len(tracking_result_folders)}] Processing: {location_name}")
-        print("-" * 80)
-        
-        try:
-            analyzer = SubtrackAnalyzer(
-                tracking_result_folder,
-                max_splits=max_splits,
-                min_duration=min_duration
-            )
-            success = analyzer.run()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, total)
+    
+    def finish(location_name, success):
+        """Record one location's outcome."""
+        nonlocal successful, failed
+        results[location_name] = success
+        if success:
+            logger.info(f"✓ {location_name} completed successfully\n")
+            successful += 1
+        else:
+            logger.error(f"✗ {location_name} failed\n")
+            failed += 1
+    
+    if max_workers <= 1:
+        for idx, tracking_result_folder in enumerate(tracking_result_folders, 1):
+            if stop_event is not None and stop_event.is_set():
+                logger.warning(f"⚠ Subtrack analysis stopped by user after {idx - 1}/{total} locations")
+                break
             
-            if success:
-                print(f"✓ {location_name} completed successfully\n")
-                results[location_name] = True
-                successful += 1
-            else:
-                print(f"✗ {location_name} failed\n")
-                results[location_name] = False
-                failed += 1
+            location_name = clean_location_name(tracking_result_folder.parent.name)  # Remove '_cropped' suffix if present
+            
+            logger.info(f"[{idx}/{total}] Processing: {location_name}")
+            logger.info("-" * 80)
+            
+            finish(location_name, _analyze_one_location(tracking_result_folder, max_splits, min_duration))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_analyze_location_worker, folder, max_splits, min_duration): folder
+                for folder in tracking_result_folders
+            }
+            
+            stopped = False
+            for idx, future in enumerate(as_completed(futures), 1):
+                if not stopped and stop_event is not None and stop_event.is_set():
+                    # Running locations finish and are still reported; queued ones never start
+                    stopped = True
+                    for pending in futures:
+                        pending.cancel()
+                    logger.warning("⚠ Subtrack analysis stopped by user")
+                if future.cancelled():
+                    continue
                 
-        except Exception as e:
-            print(f"✗ Error processing {location_name}: {e}\n")
-            results[location_name] = False
-            failed += 1
+                location_name = clean_location_name(futures[future].parent.name)
+                
+                logger.info(f"[{idx}/{total}] Processing: {location_name}")
+                logger.info("-" * 80)
+                
+                try:
+                    success, records = future.result()
+                except Exception as e:
+                    success, records = False, [(logging.ERROR, f"✗ Error processing {location_name}: {e}")]
+                
+                for levelno, message in records:
+                    logger.log(levelno, message)
+                finish(location_name, success)
     
     # Print summary
-    print("=" * 80)
-    print("BATCH ANALYSIS COMPLETE!")
-    print("=" * 80)
-    print(f"Total locations: {len(tracking_result_folders)}")
-    print(f"Successful: {successful}")
-    print(f"Failed: {failed}")
-    print("=" * 80)
+    logger.info("=" * 80)
+    logger.info("BATCH ANALYSIS COMPLETE!")
+    logger.info("=" * 80)
+    logger.info(f"Total locations: {total}")
+    logger.info(f"Successful: {successful}")
+    logger.info(f"Failed: {failed}")
+    logger.info("=" * 80)
     
     return results
 
 
+def _analyze_one_location(
+    tracking_result_folder: Path,
+    max_splits: Optional[int],
+    min_duration: Optional[int]
+) -> bool:
+    """Run the analysis for one Tracking Result folder, logging any error."""
+    location_name = clean_location_name(tracking_result_folder.parent.name)
+    try:
+        analyzer = SubtrackAnalyzer(
+            tracking_result_folder,
+            max_splits=max_splits,
+            min_duration=min_duration
+        )
+        return bool(analyzer.run())
+    except Exception as e:
+        logger.error(f"✗ Error processing {location_name}: {e}")
+        return False
+
+
+def _analyze_location_worker(
+    tracking_result_folder: Path,
+    max_splits: Optional[int],
+    min_duration: Optional[int]
+) -> Tuple[bool, List[Tuple[int, str]]]:
+    """
+    Analyze a single location in a worker process.
+    
+    Log records are collected instead of emitted, since the worker has no
+    handlers of its own; the parent re-logs them in order.
+    
+    Returns:
+        (success, [(levelno, message)])
+    """
+    collector = _RecordCollector()
+    saved_level, saved_propagate = logger.level, logger.propagate
+    logger.addHandler(collector)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        success = _analyze_one_location(tracking_result_folder, max_splits, min_duration)
+    finally:
+        logger.removeHandler(collector)
+        logger.setLevel(saved_level)
+        logger.propagate = saved_propagate
+    
+    return success, collector.records
+
+
+class _RecordCollector(logging.Handler):
+    """Logging handler that keeps (levelno, message) pairs for the parent process."""
+    
+    def __init__(self):
+        super().__init__()
+        self.records: List[Tuple[int, str]] = []
+    
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
 # ============================================================================
 # COMMAND LINE INTERFACE
 # ============================================================================
 def main():
     """Command line interface for subtrack analysis."""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     parser = argparse.ArgumentParser(
         description='Subtrack Lineage Analysis Pipeline - Analyze TrackMate tracking data',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -692,7 +1097,7 @@ Examples:
     if args.batch:
         parent_folder = Path(args.batch)
         if not parent_folder.exists():
-            print(f"✗ Error: Parent folder not found: {parent_folder}")
+            logger.error(f"✗ Error: Parent folder not found: {parent_folder}")
             sys.exit(1)
         
         results = batch_analyze_all_locations(
@@ -709,7 +1114,7 @@ Examples:
     elif args.folder:
         tracking_folder = Path(args.folder)
         if not tracking_folder.exists():
-            print(f"✗ Error: Tracking Result folder not found: {tracking_folder}")
+            logger.error(f"✗ Error: Tracking Result folder not found: {tracking_folder}")
             sys.exit(1)
         
         analyzer = SubtrackAnalyzer(
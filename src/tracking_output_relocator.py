@@ -13,11 +13,40 @@ Date: 2026-02-13
 """
 
 import os
+import re
+import logging
 import shutil
+import threading
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 
+logger = logging.getLogger(__name__)
+
+# Tracking file types relocated from the output folder (lowercase)
+TRACKING_FILE_EXTENSIONS = ('.tif', '.csv', '.avi', '.xml')
+
+# Whether os.rename can take open directory descriptors (POSIX, not Windows)
+RENAME_WITH_DIR_FD = os.rename in os.supports_dir_fd
+
+# Most worker threads moving locations concurrently
+MAX_RELOCATION_WORKERS = 32
+
+# Marker ending the location prefix of a tracking output filename
+SEGMENTATION_MARKER = "_Red_Seg"
+
+# Location prefix fields: rep, time, type, then the rest (location IDs may contain '_')
+_PREFIX_RE = re.compile(r'([^_]*)_([^_]*)_([^_]*)_(.*)', re.DOTALL)
+
+
+def _open_dir(path: str) -> Optional[int]:
+    """Open a folder for use as a dir_fd, or return None if it cannot be opened."""
+    try:
+        return os.open(path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    except OSError:
+        return None
+
 
 class TrackingOutputRelocator:
     """
@@ -56,159 +85,244 @@ class TrackingOutputRelocator:
         Returns:
             Tuple of (rep, time, type, location, original_filename) or None if parsing fails
         """
-        # Check if file has expected pattern
-        if "_Red_Seg" not in filename:
-            return None
-        
         # Extract prefix (everything before _Red_Seg)
-        prefix = filename.split("_Red_Seg")[0]
-        parts = prefix.split("_")
+        prefix, marker, _ = filename.partition(SEGMENTATION_MARKER)
+        if not marker:
+            return None
         
-        if len(parts) < 4:
+        # Split into components in one match
+        match = _PREFIX_RE.fullmatch(prefix)
+        if match is None:
             return None
         
-        # Parse components
-        rep = parts[0].replace("Rep-", "Rep ")  # "Rep-3" -> "Rep 3"
-        time = parts[1]  # "0-24h"
-        type_ = parts[2]  # "Dense" or "10um"
-        location = "_".join(parts[3:])  # Reconstruct full location ID (e.g., "B1_12")
+        rep = match[1].replace("Rep-", "Rep ")  # "Rep-3" -> "Rep 3"
+        time = match[2]  # "0-24h"
+        type_ = match[3]  # "Dense" or "10um"
+        location = match[4]  # Full location ID (e.g., "B1_12")
         
         return (rep, time, type_, location, filename)
     
-    def group_files_by_location(self) -> Dict[str, List[str]]:
+    def group_files_by_location(self) -> Dict[Tuple[str, str, str, str], List[str]]:
         """
-        Group all files in the output folder by their location prefix.
+        Group all files in the output folder by their location.
         
         Returns:
-            Dictionary mapping location prefixes to list of filenames
+            Dictionary mapping parsed (rep, time, type, location) tuples to list of filenames
         """
         prefix_map = defaultdict(list)
         
         if not self.output_folder.exists():
-            print(f"✗ Output folder does not exist: {self.output_folder}")
+            logger.error(f"✗ Output folder does not exist: {self.output_folder}")
             return {}
         
-        for file in self.output_folder.iterdir():
-            if not file.is_file():
-                continue
-            
-            # Only process known tracking file types
-            if not file.suffix.lower() in ['.tif', '.csv', '.avi', '.xml']:
-                continue
-            
-            self.stats['total_files'] += 1
-            
-            # Parse filename
-            parsed = self.parse_filename(file.name)
-            if parsed is None:
-                print(f"  ⚠️  Skipped: {file.name} (unrecognized format)")
-                self.stats['skipped'] += 1
-                continue
-            
-            rep, time, type_, location, _ = parsed
-            prefix = f"{rep}_{time}_{type_}_{location}"
-            prefix_map[prefix].append(file.name)
+        # Files of one location usually list next to each other, so keep the
+        # current location's list at hand rather than looking it up per file
+        last_key = None
+        last_bucket = None
+        
+        # scandir gives the file type from the directory listing, so no
+        # per-file stat round trip on network shares
+        with os.scandir(self.output_folder) as entries:
+            for entry in entries:
+                # Only process known tracking file types; the name test comes
+                # first so other entries never need is_file(), which has to
+                # stat where the listing carries no file type
+                if not entry.name.lower().endswith(TRACKING_FILE_EXTENSIONS):
+                    continue
+                
+                if not entry.is_file():
+                    continue
+                
+                self.stats['total_files'] += 1
+                
+                # Parse filename
+                parsed = self.parse_filename(entry.name)
+                if parsed is None:
+                    logger.warning(f"  ⚠️  Skipped: {entry.name} (unrecognized format)")
+                    self.stats['skipped'] += 1
+                    continue
+                
+                # Key on the parsed location so relocation need not parse again
+                location_key = parsed[:4]
+                if location_key != last_key:
+                    last_key = location_key
+                    last_bucket = prefix_map[location_key]
+                last_bucket.append(entry.name)
         
         return prefix_map
     
-    def relocate_location_files(self, prefix: str, filelist: List[str]) -> bool:
+    def relocate_location_files(self, location_key: Tuple[str, str, str, str],
+                                filelist: List[str]) -> bool:
         """
         Relocate all files for a single location.
         
         Args:
-            prefix: Location prefix (Rep_Time_Type_Location)
+            location_key: Parsed (rep, time, type, location) of the files
             filelist: List of filenames to move
             
         Returns:
             True if successful, False otherwise
         """
+        return self._record_location(*self._move_location_files(location_key, filelist))
+    
+    def _move_location_files(
+        self,
+        location_key: Tuple[str, str, str, str],
+        filelist: List[str]
+    ) -> Tuple[Dict[str, int], List[Tuple[int, str]]]:
+        """
+        Move one location's files without touching shared state, so locations
+        can run on worker threads.
+        
+        Returns:
+            Tuple of (statistics increments, (log level, message) records)
+        """
+        counts = {'moved': 0, 'errors': 0, 'locations_updated': 0}
+        messages = []
         try:
-            # Parse the first file to get location info
-            parsed = self.parse_filename(filelist[0])
-            if parsed is None:
-                return False
-            
-            rep, time, type_, location, _ = parsed
+            rep, time, type_, location = location_key
             
             # Construct target folder path
             location_path = self.root_data_folder / rep / time / type_ / location
             
-            if not location_path.exists():
-                print(f"  ✗ Target folder not found: {location_path}")
-                self.stats['errors'] += 1
-                return False
-            
-            # Create Tracking Result subfolder
+            # Create Tracking Result subfolder; a missing location folder shows up
+            # as FileNotFoundError, so no separate exists() probe is needed
             result_path = location_path / "Tracking Result"
-            result_path.mkdir(exist_ok=True)
+            try:
+                result_path.mkdir(exist_ok=True)
+            except FileNotFoundError:
+                messages.append((logging.ERROR, f"  ✗ Target folder not found: {location_path}"))
+                counts['errors'] += 1
+                return counts, messages
             
-            # Move all files
-            moved_count = 0
-            for filename in filelist:
-                src = self.output_folder / filename
-                dst = result_path / filename
-                
-                try:
-                    shutil.move(str(src), str(dst))
-                    moved_count += 1
-                    self.stats['moved'] += 1
-                except Exception as e:
-                    print(f"    ✗ Failed to move {filename}: {e}")
-                    self.stats['errors'] += 1
+            # Move all files (paths joined as strings, converted once per location)
+            src_dir = str(self.output_folder)
+            dst_dir = str(result_path)
             
-            if moved_count > 0:
-                print(f"  ✓ Moved {moved_count} file(s) → {rep} / {time} / {type_} / {location}")
-                self.stats['locations_updated'] += 1
-                return True
+            # Where supported, rename relative to the two open folders so the
+            # kernel only resolves each file name, not the whole path
+            src_fd = _open_dir(src_dir) if RENAME_WITH_DIR_FD else None
+            dst_fd = _open_dir(dst_dir) if src_fd is not None else None
+            try:
+                for filename in filelist:
+                    try:
+                        try:
+                            # Same volume: a metadata-only rename
+                            if dst_fd is not None:
+                                os.rename(filename, filename, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+                            else:
+                                os.rename(os.path.join(src_dir, filename),
+                                          os.path.join(dst_dir, filename))
+                        except OSError:
+                            # Different volume (or existing target on Windows)
+                            shutil.move(os.path.join(src_dir, filename),
+                                        os.path.join(dst_dir, filename))
+                        counts['moved'] += 1
+                    except Exception as e:
+                        messages.append((logging.ERROR, f"    ✗ Failed to move {filename}: {e}"))
+                        counts['errors'] += 1
+            finally:
+                for fd in (src_fd, dst_fd):
+                    if fd is not None:
+                        os.close(fd)
             
-            return False
+            if counts['moved'] > 0:
+                messages.append((logging.INFO, f"  ✓ Moved {counts['moved']} file(s) → {rep} / {time} / {type_} / {location}"))
+                counts['locations_updated'] += 1
             
         except Exception as e:
-            print(f"  ✗ Error processing {prefix}: {e}")
-            self.stats['errors'] += 1
-            return False
+            messages.append((logging.ERROR, f"  ✗ Error processing {'_'.join(location_key)}: {e}"))
+            counts['errors'] += 1
+        
+        return counts, messages
     
-    def relocate_all(self) -> Dict[str, int]:
+    def _record_location(self, counts: Dict[str, int], messages: List[Tuple[int, str]]) -> bool:
+        """Log one location's messages and add its counts to the statistics."""
+        for level, message in messages:
+            logger.log(level, message)
+        for key, value in counts.items():
+            self.stats[key] += value
+        return counts['locations_updated'] > 0
+    
+    def relocate_all(
+        self,
+        max_workers: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None
+    ) -> Dict[str, int]:
         """
         Relocate all tracking output files.
         
+        Moves are dominated by file system calls that release the GIL, so
+        locations are moved on a thread pool; their messages and statistics
+        are recorded in location order.
+        
+        Args:
+            max_workers: Number of worker threads (default: one per location, up
+                to MAX_RELOCATION_WORKERS); 1 moves locations sequentially
+            stop_event: Optional event; once set, locations not yet started are skipped
+        
         Returns:
             Dictionary with relocation statistics
         """
-        print("=" * 80)
-        print("TRACKING OUTPUT RELOCATION")
-        print("=" * 80)
-        print(f"Output folder: {self.output_folder}")
-        print(f"Data root: {self.root_data_folder}")
-        print()
+        logger.info("=" * 80)
+        logger.info("TRACKING OUTPUT RELOCATION")
+        logger.info("=" * 80)
+        logger.info(f"Output folder: {self.output_folder}")
+        logger.info(f"Data root: {self.root_data_folder}")
+        logger.info("")
         
         # Group files by location
-        print("Analyzing files...")
+        logger.info("Analyzing files...")
         prefix_map = self.group_files_by_location()
         
         if not prefix_map:
-            print("✗ No files to relocate")
+            logger.error("✗ No files to relocate")
             return self.stats
         
-        print(f"Found {len(prefix_map)} location(s) with tracking results")
-        print()
+        logger.info(f"Found {len(prefix_map)} location(s) with tracking results")
+        logger.info("")
         
         # Process each location
-        print("Relocating files...")
-        for prefix, filelist in prefix_map.items():
-            self.relocate_location_files(prefix, filelist)
+        logger.info("Relocating files...")
+        if max_workers is None:
+            max_workers = MAX_RELOCATION_WORKERS
+        max_workers = min(max_workers, len(prefix_map))
+        
+        if max_workers <= 1:
+            for location_key, filelist in prefix_map.items():
+                if stop_event is not None and stop_event.is_set():
+                    logger.warning("⚠ Relocation stopped by user")
+                    break
+                self.relocate_location_files(location_key, filelist)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(self._move_location_files, location_key, filelist)
+                    for location_key, filelist in prefix_map.items()
+                ]
+                stopped = False
+                for future in futures:
+                    if not stopped and stop_event is not None and stop_event.is_set():
+                        # Running locations finish and are still recorded; queued ones never start
+                        stopped = True
+                        for pending in futures:
+                            pending.cancel()
+                        logger.warning("⚠ Relocation stopped by user")
+                    if future.cancelled():
+                        continue
+                    self._record_location(*future.result())
         
         # Print summary
-        print()
-        print("=" * 80)
-        print("RELOCATION COMPLETE")
-        print("=" * 80)
-        print(f"Total files processed: {self.stats['total_files']}")
-        print(f"Files moved: {self.stats['moved']}")
-        print(f"Files skipped: {self.stats['skipped']}")
-        print(f"Errors: {self.stats['errors']}")
-        print(f"Locations updated: {self.stats['locations_updated']}")
-        print("=" * 80)
+        logger.info("")
+        logger.info("=" * 80)
+        logger.info("RELOCATION COMPLETE")
+        logger.info("=" * 80)
+        logger.info(f"Total files processed: {self.stats['total_files']}")
+        logger.info(f"Files moved: {self.stats['moved']}")
+        logger.info(f"Files skipped: {self.stats['skipped']}")
+        logger.info(f"Errors: {self.stats['errors']}")
+        logger.info(f"Locations updated: {self.stats['locations_updated']}")
+        logger.info("=" * 80)
         
         return self.stats
 
@@ -232,6 +346,8 @@ if __name__ == "__main__":
     # Example usage
     import argparse
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     parser = argparse.ArgumentParser(
         description="Relocate TrackMate tracking outputs back to original data folders"
     )